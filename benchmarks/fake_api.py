@@ -0,0 +1,307 @@
+"""In-process stand-in for sly.Api with a synthetic project, used by the benchmarks.
+
+Only the methods which are used by the app are implemented. Images and annotations are
+not stored as objects: objects of each image are kept in flat arrays and ImageInfos and
+annotation JSONs are created on request, so projects with millions of images fit in memory.
+Each method counts the number of requests which the real API would send and sleeps for
+the simulated latency once per request.
+"""
+
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+import supervisely as sly
+from supervisely.api.dataset_api import DatasetInfo
+from supervisely.api.image_api import ImageInfo
+from supervisely.api.project_api import ProjectInfo
+
+# Approximate page and batch sizes of the real API, used to count requests.
+LIST_PAGE_SIZE = 500
+BATCH_SIZE = 50
+
+PROJECT_ID = 1
+FIRST_DATASET_ID = 100
+FIRST_IMAGE_ID = 1000000
+UPDATED_AT = "2024-01-01T00:00:00.000Z"
+
+
+class FakeProject:
+    """Synthetic project with Poisson numbers of objects per image and Zipf-distributed classes."""
+
+    def __init__(
+        self,
+        images_count: int,
+        datasets_count: int = 10,
+        classes_count: int = 20,
+        labels_per_image: float = 3.0,
+        seed: int = 0,
+    ):
+        rng = np.random.default_rng(seed)
+        datasets_count = max(1, min(datasets_count, images_count))
+
+        self.class_names = [f"class_{index}" for index in range(classes_count)]
+        self.meta = sly.ProjectMeta(
+            obj_classes=[sly.ObjClass(name, sly.Rectangle) for name in self.class_names]
+        )
+
+        self.image_ids = np.arange(FIRST_IMAGE_ID, FIRST_IMAGE_ID + images_count, dtype=np.int64)
+        self.image_dataset_ids = FIRST_DATASET_ID + np.repeat(
+            np.arange(datasets_count),
+            np.diff(np.linspace(0, images_count, datasets_count + 1).astype(np.int64)),
+        )
+        self.dataset_ids = list(range(FIRST_DATASET_ID, FIRST_DATASET_ID + datasets_count))
+
+        # Objects of the i-th image are label_classes[label_offsets[i]:label_offsets[i + 1]].
+        labels_counts = rng.poisson(labels_per_image, images_count)
+        self.label_offsets = np.concatenate([[0], np.cumsum(labels_counts)])
+        weights = 1 / np.arange(1, classes_count + 1)
+        self.label_classes = rng.choice(
+            classes_count, size=self.label_offsets[-1], p=weights / weights.sum()
+        ).astype(np.int32)
+
+    @property
+    def images_count(self) -> int:
+        return len(self.image_ids)
+
+    def get_dataset_image_ids(self, dataset_id: int) -> np.ndarray:
+        return self.image_ids[self.image_dataset_ids == dataset_id]
+
+    def get_image_info(self, image_id: int) -> ImageInfo:
+        index = image_id - FIRST_IMAGE_ID
+        return ImageInfo(
+            id=image_id,
+            name=f"image_{image_id}.jpg",
+            link=None,
+            hash=f"hash_{image_id}",
+            mime="image/jpeg",
+            ext="jpg",
+            size=100000,
+            width=640,
+            height=480,
+            labels_count=int(self.label_offsets[index + 1] - self.label_offsets[index]),
+            dataset_id=int(self.image_dataset_ids[index]),
+            created_at=UPDATED_AT,
+            updated_at=UPDATED_AT,
+            meta={},
+            path_original=f"/images/{image_id}.jpg",
+            full_storage_url=f"http://localhost/images/{image_id}.jpg",
+            tags=[],
+        )
+
+    def get_ann_json(self, image_id: int) -> dict:
+        index = image_id - FIRST_IMAGE_ID
+        start, end = self.label_offsets[index], self.label_offsets[index + 1]
+        return {
+            "description": "",
+            "size": {"height": 480, "width": 640},
+            "tags": [],
+            "objects": [
+                {
+                    "classTitle": self.class_names[class_index],
+                    "geometryType": "rectangle",
+                    "points": {"exterior": [[10, 10], [100, 100]], "interior": []},
+                    "tags": [],
+                }
+                for class_index in self.label_classes[start:end].tolist()
+            ],
+        }
+
+    def get_objects_counts(self) -> np.ndarray:
+        return np.bincount(self.label_classes, minlength=len(self.class_names))
+
+
+class FakeApi:
+    """Stand-in for sly.Api which serves the synthetic project and accepts uploads."""
+
+    def __init__(self, project: FakeProject, latency: float = 0.0):
+        self.source = project
+        self.latency = latency
+        self.calls = Counter()
+        self.uploaded_ids = []
+        self.removed_ids = []
+        self._lock = threading.Lock()
+        self._next_id = 10**9
+
+        self.project = _ProjectApi(self)
+        self.dataset = _DatasetApi(self)
+        self.image = _ImageApi(self)
+        self.annotation = _AnnotationApi(self)
+
+    def request(self, method: str, items_count: int = 1, batch_size: Optional[int] = None):
+        """Counts the requests for the method and sleeps for the simulated latency.
+        If the batch size is specified, the items are sent in batches of this size."""
+        requests_count = 1 if batch_size is None else max(1, -(-items_count // batch_size))
+        with self._lock:
+            self.calls[method] += requests_count
+        if self.latency:
+            # Sleeping releases the GIL, so the latency of requests from different threads overlaps.
+            time.sleep(self.latency * requests_count)
+
+    def new_ids(self, count: int) -> List[int]:
+        with self._lock:
+            first_id = self._next_id
+            self._next_id += count
+        return list(range(first_id, first_id + count))
+
+    def reset_calls(self) -> Dict[str, int]:
+        """Returns the counted requests and starts counting from zero."""
+        with self._lock:
+            calls = dict(self.calls)
+            self.calls.clear()
+        return calls
+
+
+class _ProjectApi:
+    def __init__(self, api: FakeApi):
+        self._api = api
+
+    def get_info_by_id(self, id: int) -> ProjectInfo:
+        self._api.request("project.get_info_by_id")
+        source = self._api.source
+        return ProjectInfo(
+            id=id,
+            name="Synthetic project",
+            description="",
+            size=0,
+            readme="",
+            workspace_id=1,
+            images_count=source.images_count,
+            items_count=source.images_count,
+            datasets_count=len(source.dataset_ids),
+            created_at=UPDATED_AT,
+            updated_at=UPDATED_AT,
+            type=str(sly.ProjectType.IMAGES),
+            reference_image_url=None,
+            custom_data={},
+            backup_archive={},
+            team_id=1,
+            settings={},
+            import_settings={},
+        )
+
+    def get_images_count(self, id: int) -> int:
+        self._api.request("project.get_images_count")
+        return self._api.source.images_count
+
+    def get_meta(self, id: int) -> dict:
+        self._api.request("project.get_meta")
+        return self._api.source.meta.to_json()
+
+    def get_stats(self, id: int) -> dict:
+        self._api.request("project.get_stats")
+        source = self._api.source
+        return {
+            "objects": {
+                "items": [
+                    {"objectClass": {"name": class_name}, "total": int(total)}
+                    for class_name, total in zip(
+                        source.class_names, source.get_objects_counts().tolist()
+                    )
+                ]
+            }
+        }
+
+    def update_meta(self, id: int, meta):
+        self._api.request("project.update_meta")
+
+    def create(self, workspace_id: int, name: str, **kwargs) -> SimpleNamespace:
+        self._api.request("project.create")
+        return SimpleNamespace(id=self._api.new_ids(1)[0], name=name)
+
+
+class _DatasetApi:
+    def __init__(self, api: FakeApi):
+        self._api = api
+
+    def get_list(self, project_id: int, **kwargs) -> List[DatasetInfo]:
+        self._api.request("dataset.get_list")
+        return [self._get_info(dataset_id) for dataset_id in self._api.source.dataset_ids]
+
+    def get_info_by_id(self, id: int) -> Optional[DatasetInfo]:
+        self._api.request("dataset.get_info_by_id")
+        return self._get_info(id) if id in self._api.source.dataset_ids else None
+
+    def create(self, project_id: int, name: str, **kwargs) -> SimpleNamespace:
+        self._api.request("dataset.create")
+        return SimpleNamespace(id=self._api.new_ids(1)[0], name=name)
+
+    def _get_info(self, dataset_id: int) -> DatasetInfo:
+        images_count = len(self._api.source.get_dataset_image_ids(dataset_id))
+        return DatasetInfo(
+            id=dataset_id,
+            name=f"dataset_{dataset_id}",
+            description="",
+            size=0,
+            project_id=PROJECT_ID,
+            images_count=images_count,
+            items_count=images_count,
+            created_at=UPDATED_AT,
+            updated_at=UPDATED_AT,
+            reference_image_url=None,
+            team_id=1,
+            workspace_id=1,
+            parent_id=None,
+        )
+
+
+class _ImageApi:
+    def __init__(self, api: FakeApi):
+        self._api = api
+
+    def get_list(
+        self, dataset_id: int, filters: Optional[List[dict]] = None, **kwargs
+    ) -> List[ImageInfo]:
+        image_ids = self._api.source.get_dataset_image_ids(dataset_id)
+        for condition in filters or []:
+            if condition["field"] == "id" and condition["operator"] == "in":
+                image_ids = image_ids[np.isin(image_ids, condition["value"])]
+
+        self._api.request("image.get_list", len(image_ids), LIST_PAGE_SIZE)
+        return [self._api.source.get_image_info(image_id) for image_id in image_ids.tolist()]
+
+    def get_list_generator(self, dataset_id: int, batch_size: int = None, **kwargs):
+        image_ids = self._api.source.get_dataset_image_ids(dataset_id).tolist()
+        batch_size = batch_size or LIST_PAGE_SIZE
+        for page_ids in sly.batched(image_ids, batch_size):
+            self._api.request("image.get_list_generator", len(page_ids), LIST_PAGE_SIZE)
+            yield [self._api.source.get_image_info(image_id) for image_id in page_ids]
+
+    def upload_ids(
+        self, dataset_id: int, names: List[str], ids: List[int], batch_size: int = BATCH_SIZE, **kwargs
+    ):
+        self._api.request("image.upload_ids", len(ids), batch_size)
+        with self._api._lock:
+            self._api.uploaded_ids.extend(ids)
+        return [
+            SimpleNamespace(id=new_id, name=name)
+            for new_id, name in zip(self._api.new_ids(len(ids)), names)
+        ]
+
+    def remove_batch(self, ids: List[int], batch_size: int = BATCH_SIZE, **kwargs):
+        self._api.request("image.remove_batch", len(ids), batch_size)
+        with self._api._lock:
+            self._api.removed_ids.extend(ids)
+
+
+class _AnnotationApi:
+    def __init__(self, api: FakeApi):
+        self._api = api
+
+    def download_json_batch(self, dataset_id: int, image_ids: List[int], **kwargs) -> List[dict]:
+        self._api.request("annotation.download_json_batch", len(image_ids), BATCH_SIZE)
+        return [self._api.source.get_ann_json(image_id) for image_id in image_ids]
+
+    def upload_jsons(self, img_ids: List[int], ann_jsons: List[dict], **kwargs):
+        self._api.request("annotation.upload_jsons", len(img_ids), BATCH_SIZE)
+
+    def upload_anns(self, img_ids: List[int], anns: List[sly.Annotation], **kwargs):
+        self._api.request("annotation.upload_anns", len(img_ids), BATCH_SIZE)
+
+    def copy_batch_by_ids(
+        self, src_image_ids: List[int], dst_image_ids: List[int], batch_size: int = BATCH_SIZE, **kwargs
+    ):
+        self._api.request("annotation.copy_batch_by_ids", len(src_image_ids), batch_size)
@@ -0,0 +1,175 @@
+"""Benchmarks of indexing, sampling and uploading on synthetic projects.
+
+Usage:
+    python -m benchmarks.run --sizes 1000 10000 100000 1000000 --latency 0.01
+
+The app works with the in-process fake API from benchmarks/fake_api.py, so the benchmarks
+don't need the Supervisely instance. For each project size the wall time, the peak memory
+allocated by Python and NumPy and the number of API requests are reported for each stage.
+Memory is traced with tracemalloc which slows down the code, use --no-memory to measure
+the time without it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+
+# The app reads the settings from the environment on import.
+DATA_DIR = tempfile.mkdtemp(prefix="sampling-benchmark-")
+os.environ["SLY_APP_DATA_DIR"] = DATA_DIR
+os.environ.setdefault("SERVER_ADDRESS", "http://localhost")
+os.environ.setdefault("API_TOKEN", "x" * 128)
+
+import numpy as np  # noqa: E402
+import supervisely as sly  # noqa: E402
+
+import src.cache as cache  # noqa: E402
+import src.engine as engine  # noqa: E402
+import src.globals as g  # noqa: E402
+from benchmarks.fake_api import PROJECT_ID, FakeApi, FakeProject  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+
+def measure(api: FakeApi, trace_memory: bool, func: Callable, *args, **kwargs):
+    """Calls the function and returns its result and the measurements."""
+    api.reset_calls()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+
+    peak_memory = None
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    calls = api.reset_calls()
+    return result, {
+        "wall_time": wall_time,
+        "peak_memory_mb": None if peak_memory is None else peak_memory / 2**20,
+        "api_requests": sum(calls.values()),
+        "api_calls": calls,
+    }
+
+
+def run_size(args: argparse.Namespace, images_count: int) -> List[dict]:
+    project = FakeProject(
+        images_count,
+        datasets_count=args.datasets,
+        classes_count=args.classes,
+        labels_per_image=args.labels_per_image,
+        seed=args.seed,
+    )
+    api = FakeApi(project, latency=args.latency)
+    g.api = api
+    g.STATE = g.State()
+    results = []
+
+    def add(stage: str, measurements: dict, items_count: int, processed_count: int = images_count):
+        # Throughput is the number of processed images per second: images of the project
+        # for indexing and sampling and uploaded images for upload.
+        measurements["images_per_second"] = processed_count / max(measurements["wall_time"], 1e-9)
+        results.append({"size": images_count, "stage": stage, "items": items_count, **measurements})
+
+    g.INDEX_CACHE = False
+    _, measurements = measure(api, args.trace_memory, engine.load_project, PROJECT_ID)
+    add("indexing", measurements, len(g.STATE.images))
+
+    g.INDEX_CACHE = True
+    cache.save_index(
+        cache.get_cache_path(g.SLY_APP_DATA_DIR, PROJECT_ID),
+        g.STATE.project_info.updated_at,
+        g.STATE.dump_index(),
+    )
+    _, measurements = measure(api, args.trace_memory, g.STATE.load_index)
+    add("indexing from cache", measurements, len(g.STATE.images))
+
+    rng = np.random.default_rng(args.seed)
+    images_in_sample = round(args.sample_size * images_count / 100)
+    samples, measurements = measure(
+        api, args.trace_memory, g.STATE.get_random_sample, images_in_sample, rng
+    )
+    add("sampling: Random (streaming)", measurements, len(samples))
+
+    distribution = dict(zip(project.class_names, engine.distribute_percentages(args.classes)))
+    for method in g.SAMPLING_METHODS:
+        engine.plan(method, args.sample_size, distribution if method == "Custom" else None)
+        g.STATE.seed = args.seed
+        samples, measurements = measure(api, args.trace_memory, engine.prepare_samples)
+        add(f"sampling: {method}", measurements, len(samples))
+
+    # The sample of the last method is uploaded.
+    for server_side_copy in (False, True):
+        g.STATE.server_side_copy = server_side_copy
+        api.uploaded_ids.clear()
+        _, measurements = measure(api, args.trace_memory, engine.upload_samples, samples)
+        stage = "upload (server-side copy)" if server_side_copy else "upload"
+        add(stage, measurements, len(api.uploaded_ids), len(api.uploaded_ids))
+
+    return results
+
+
+def print_results(results: List[dict]):
+    header = f"{'size':>9} {'stage':<30} {'items':>9} {'time, s':>9} {'images/s':>11} {'peak, MB':>9} {'requests':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        peak_memory = (
+            "-" if result["peak_memory_mb"] is None else f"{result['peak_memory_mb']:.1f}"
+        )
+        print(
+            f"{result['size']:>9} {result['stage']:<30} {result['items']:>9} "
+            f"{result['wall_time']:>9.3f} {result['images_per_second']:>11.0f} "
+            f"{peak_memory:>9} {result['api_requests']:>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app on synthetic projects.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of images in the projects."
+    )
+    parser.add_argument("--datasets", type=int, default=10, help="Number of datasets in each project.")
+    parser.add_argument("--classes", type=int, default=20, help="Number of classes in each project.")
+    parser.add_argument(
+        "--labels-per-image", type=float, default=3.0, help="Average number of objects on the image."
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency of one API request in seconds.")
+    parser.add_argument(
+        "--sample-size", type=int, default=10, help="Size of the sample in percent of the images."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic projects and samplers.")
+    parser.add_argument(
+        "--no-memory", dest="trace_memory", action="store_false", help="Don't trace the peak memory."
+    )
+    parser.add_argument("--output", help="Path to the JSON file with the results.")
+    args = parser.parse_args()
+
+    sly.logger.setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for images_count in args.sizes:
+            size_results = run_size(args, images_count)
+            print_results(size_results)
+            print()
+            results.extend(size_results)
+    finally:
+        shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
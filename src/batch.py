@@ -0,0 +1,160 @@
+"""Batch mode which runs several sampling jobs in a pool of worker processes.
+
+Usage:
+    python -m src.batch --config batch.yaml
+
+The config is a YAML or JSON file with the list of jobs, each job has the same fields
+as the config of the headless mode (see src/cli.py) and an optional name. The name and the
+destination are a part of the key of the job journal, so jobs with the same settings can run
+at the same time if their names or destinations are different:
+
+    processes: 4                # Number of worker processes.
+    max_api_requests: 16        # Maximum number of API requests at the same time in all processes.
+    jobs:
+      - name: cats
+        project_id: 12345
+        method: Random
+        sample_size: 10
+      - project_id: 67890
+        method: Stratified
+        images_number: 500
+        destination:
+          project_name: Evaluation
+"""
+
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+import supervisely as sly
+import yaml
+
+import src.cli as cli
+import src.globals as g
+
+DEFAULT_PROCESSES = 4
+DEFAULT_MAX_API_REQUESTS = 16
+
+# Semaphore shared by all worker processes, it's set in the initializer of the worker.
+api_semaphore = None
+
+
+class ThrottledApi(sly.Api):
+    """Api which waits for the shared semaphore before each request, so all worker
+    processes together don't send more than the limit of requests at the same time."""
+
+    def post(self, *args, **kwargs):
+        with api_semaphore:
+            return super().post(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        with api_semaphore:
+            return super().get(*args, **kwargs)
+
+
+def init_worker(semaphore):
+    global api_semaphore
+    api_semaphore = semaphore
+    g.api = ThrottledApi.from_env()
+
+
+def run_worker_job(job_name: str, config: dict) -> dict:
+    # Each job starts with the clean state, even if the process has already run another job.
+    g.STATE = g.State()
+    sly.logger.info(f"Job {job_name} is started.")
+
+    project_id, dataset_id, uploaded = cli.run_job(config)
+
+    return {
+        "project_id": project_id,
+        "dataset_id": dataset_id,
+        "uploaded": uploaded,
+        "finished": g.STATE.continue_sampling,
+    }
+
+
+def run_batch(
+    jobs: List[dict],
+    processes: Optional[int] = None,
+    max_api_requests: Optional[int] = None,
+) -> List[dict]:
+    """Runs the sampling jobs in worker processes, returns the results in the order of the jobs.
+    Failure of one job doesn't affect the others, its error is returned in the results."""
+    processes = processes or DEFAULT_PROCESSES
+    max_api_requests = max_api_requests or DEFAULT_MAX_API_REQUESTS
+
+    # Spawned processes don't inherit the threads and the state of the parent process.
+    context = multiprocessing.get_context("spawn")
+    semaphore = context.BoundedSemaphore(max_api_requests)
+
+    results = [None] * len(jobs)
+    job_names = [job.get("name") or get_default_name(index, job) for index, job in enumerate(jobs)]
+
+    sly.logger.info(
+        f"Running {len(jobs)} jobs in {processes} processes with "
+        f"at most {max_api_requests} API requests at the same time."
+    )
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(semaphore,),
+    ) as executor:
+        futures = {
+            executor.submit(run_worker_job, job_names[index], job): index
+            for index, job in enumerate(jobs)
+        }
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                sly.logger.error(
+                    f"[{done}/{len(jobs)}] Job {job_names[index]} failed: {e!r}"
+                )
+                results[index] = {"name": job_names[index], "error": repr(e)}
+                continue
+
+            sly.logger.info(
+                f"[{done}/{len(jobs)}] Job {job_names[index]} is finished, uploaded "
+                f"{result['uploaded']} images to the dataset {result['dataset_id']}."
+            )
+            results[index] = {"name": job_names[index], **result}
+
+    return results
+
+
+def get_default_name(index: int, job: dict) -> str:
+    if "manifest" in job:
+        return f"#{index + 1} (manifest {job['manifest']})"
+
+    return f"#{index + 1} (project {job.get('project_id')})"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sample images from several projects in worker processes."
+    )
+    parser.add_argument("--config", required=True, help="Path to the YAML or JSON batch config.")
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = yaml.safe_load(f)
+
+    jobs = config.get("jobs") or []
+    for index, job in enumerate(jobs, start=1):
+        cli.validate_config(job, f"{args.config} (job #{index})")
+
+    results = run_batch(jobs, config.get("processes"), config.get("max_api_requests"))
+
+    failed = [result["name"] for result in results if "error" in result]
+    if failed:
+        sly.logger.error(f"{len(failed)} of {len(results)} jobs failed: {failed}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Ordinals are split into chunks by their high bits, each chunk is a separate container.
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+# Chunks with more values are stored as bitmaps, chunks with fewer values as sorted arrays,
+# both take at most 8 KB.
+ARRAY_MAX_SIZE = 4096
+
+# Number of set bits in each byte value.
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# Operators of set expressions: "a & b" is the intersection, "a | b" is the union
+# and "!a" is the complement, "&" binds tighter than "|".
+AND = "&"
+OR = "|"
+NOT = "!"
+
+
+class Bitmap:
+    """Compressed set of image ordinals in the roaring format: chunks of 2^16 values are stored
+    as sorted uint16 arrays if they are sparse or as packed 8 KB bitmaps if they are dense."""
+
+    def __init__(self, containers: Dict[int, np.ndarray], size: int):
+        self.containers = containers
+        self.size = size
+
+    @classmethod
+    def from_ordinals(cls, ordinals: np.ndarray, size: int) -> "Bitmap":
+        ordinals = np.unique(ordinals)
+        chunks, starts = np.unique(ordinals >> CHUNK_BITS, return_index=True)
+        ends = np.append(starts[1:], len(ordinals))
+        return cls(
+            {
+                chunk: compress((ordinals[start:end] & (CHUNK_SIZE - 1)).astype(np.uint16))
+                for chunk, start, end in zip(chunks.tolist(), starts.tolist(), ends.tolist())
+            },
+            size,
+        )
+
+    @classmethod
+    def empty(cls, size: int) -> "Bitmap":
+        return cls(dict(), size)
+
+    @classmethod
+    def full(cls, size: int) -> "Bitmap":
+        full_chunks, remainder = divmod(size, CHUNK_SIZE)
+        containers = {chunk: np.full(CHUNK_SIZE // 8, 255, dtype=np.uint8) for chunk in range(full_chunks)}
+        if remainder:
+            containers[full_chunks] = compress(np.arange(remainder, dtype=np.uint16))
+        return cls(containers, size)
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        containers = dict()
+        for chunk in self.containers.keys() & other.containers.keys():
+            container = intersect(self.containers[chunk], other.containers[chunk])
+            if len(container):
+                containers[chunk] = container
+        return Bitmap(containers, self.size)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        containers = dict(self.containers)
+        for chunk, container in other.containers.items():
+            containers[chunk] = (
+                unite(containers[chunk], container) if chunk in containers else container
+            )
+        return Bitmap(containers, self.size)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        containers = dict()
+        for chunk, container in self.containers.items():
+            if chunk in other.containers:
+                container = subtract(container, other.containers[chunk])
+            if len(container):
+                containers[chunk] = container
+        return Bitmap(containers, self.size)
+
+    def __invert__(self) -> "Bitmap":
+        return Bitmap.full(self.size) - self
+
+    def __len__(self) -> int:
+        return sum(count(container) for container in self.containers.values())
+
+    def ordinals(self) -> np.ndarray:
+        """Returns the sorted ordinals of the images in the set."""
+        return np.concatenate(
+            [
+                (chunk << CHUNK_BITS) + to_values(self.containers[chunk]).astype(np.int64)
+                for chunk in sorted(self.containers)
+            ]
+            + [np.array([], dtype=np.int64)]
+        )
+
+
+def is_bitmap(container: np.ndarray) -> bool:
+    return container.dtype == np.uint8
+
+
+def compress(values: np.ndarray) -> np.ndarray:
+    """Returns the container for the sorted low bits of the chunk."""
+    if len(values) <= ARRAY_MAX_SIZE:
+        return values
+
+    mask = np.zeros(CHUNK_SIZE, dtype=bool)
+    mask[values] = True
+    return np.packbits(mask)
+
+
+def to_values(container: np.ndarray) -> np.ndarray:
+    if is_bitmap(container):
+        return np.flatnonzero(np.unpackbits(container)).astype(np.uint16)
+    return container
+
+
+def to_bits(container: np.ndarray) -> np.ndarray:
+    if is_bitmap(container):
+        return container
+    mask = np.zeros(CHUNK_SIZE, dtype=bool)
+    mask[container] = True
+    return np.packbits(mask)
+
+
+def from_bits(bits: np.ndarray) -> np.ndarray:
+    """Returns the array container for the bitmap if it became sparse."""
+    if count(bits) <= ARRAY_MAX_SIZE:
+        return np.flatnonzero(np.unpackbits(bits)).astype(np.uint16)
+    return bits
+
+
+def contains(bits: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Checks which values are set in the packed bitmap."""
+    return ((bits[values >> 3] >> (7 - (values & 7))) & 1).astype(bool)
+
+
+def count(container: np.ndarray) -> int:
+    if is_bitmap(container):
+        return int(POPCOUNT[container].sum(dtype=np.int64))
+    return len(container)
+
+
+def intersect(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    if is_bitmap(first) and is_bitmap(second):
+        return from_bits(first & second)
+    if is_bitmap(first):
+        return second[contains(first, second)]
+    if is_bitmap(second):
+        return first[contains(second, first)]
+    return np.intersect1d(first, second, assume_unique=True)
+
+
+def unite(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    if is_bitmap(first) or is_bitmap(second):
+        return to_bits(first) | to_bits(second)
+    return compress(np.union1d(first, second))
+
+
+def subtract(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    if is_bitmap(first):
+        return from_bits(first & ~to_bits(second))
+    if is_bitmap(second):
+        return first[~contains(second, first)]
+    return np.setdiff1d(first, second, assume_unique=True)
+
+
+def parse_expression(expression: str) -> List[List[Tuple[bool, str]]]:
+    """Parses the set expression to the union of intersections of (negated, name) operands,
+    e.g. "a & !b | c" -> [[(False, "a"), (True, "b")], [(False, "c")]]."""
+    terms = []
+    for term in expression.split(OR):
+        operands = []
+        for operand in term.split(AND):
+            operand = operand.strip()
+            negated = operand.startswith(NOT)
+            name = operand[1:].strip() if negated else operand
+            if not name:
+                raise ValueError(f"Expression {expression} has an empty operand.")
+            operands.append((negated, name))
+        terms.append(operands)
+
+    return terms
+
+
+def is_expression(name: str) -> bool:
+    return any(operator in name for operator in (AND, OR, NOT))
@@ -0,0 +1,56 @@
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import supervisely as sly
+
+# Version of the cache format, caches with another version will be ignored.
+CACHE_VERSION = 4
+
+
+def get_cache_path(cache_dir: str, project_id: int, filters_key: Optional[str] = None) -> str:
+    """Returns the path of the index cache, indexes of the same project
+    with different source filters are cached separately."""
+    name = str(project_id) if filters_key is None else f"{project_id}_{filters_key}"
+    return os.path.join(cache_dir, "index_cache", f"{name}.npz")
+
+
+def save_index(path: str, updated_at: str, arrays: Dict[str, np.ndarray]):
+    """Saves the arrays of the project index to the compressed npz file, it's written
+    to the temporary path first, so the cache is never left partially written."""
+    sly.fs.mkdir(os.path.dirname(path))
+    # Several processes of the batch mode can save the index of the same project.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            cache_version=np.array(CACHE_VERSION),
+            updated_at=np.array(updated_at),
+            **arrays,
+        )
+    os.replace(temp_path, path)
+
+    sly.logger.debug(
+        f"Project index was saved to the cache {path}, size: {os.path.getsize(path)} bytes."
+    )
+
+
+def load_index(path: str) -> Optional[Dict[str, np.ndarray]]:
+    """Loads the arrays of the project index from the cache file.
+    Returns None if there's no cache or it was saved in another format."""
+    if not os.path.isfile(path):
+        sly.logger.debug(f"There's no cache of the project index in {path}.")
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as cache:
+            arrays = {key: cache[key] for key in cache.files}
+    except (OSError, ValueError) as e:
+        sly.logger.warning(f"Cache of the project index {path} can't be read: {e}")
+        return None
+
+    if arrays.pop("cache_version").item() != CACHE_VERSION:
+        sly.logger.debug("Cache of the project index has another format version.")
+        return None
+
+    return arrays
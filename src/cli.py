@@ -0,0 +1,165 @@
+"""Headless entry point which runs the sampling without the UI.
+
+Usage:
+    python -m src.cli --config job.yaml
+
+The config is a YAML or JSON file with the following fields:
+
+    project_id: 12345           # ID of the source project.
+    method: Custom              # Random, Stratified or Custom.
+    sample_size: 10             # Size of the sample in percent of the images in the project,
+    # images_number: 500        # or the number of images in the sample.
+    distribution:               # Class name -> percentage, only for the Custom method.
+      cat: 80
+      dog: 20
+      # Image tags and meta fields can be used too, combinations are joined with "&":
+      # tag:weather=rain: 30
+      # cat & meta:camera=3: 10
+      # Set expressions with & (and), | (or) and ! (not) select images by several classes:
+      # pedestrian & !cyclist: 30
+    # stratify_by: [tag:weather] # Optional, tag and meta keys for the Stratified method.
+    # exclude: [ignore]         # Optional, images of these classes or expressions are not sampled.
+    filters:                    # Optional, only images which pass the filters are sampled.
+      datasets: ["2024-*"]      # IDs or name patterns of datasets.
+      exclude_datasets: [123]
+      tags: ["reviewed", "split=train"]  # Images must have all of these tags.
+      exclude_tags: ["ignore"]  # Images with any of these tags are skipped.
+      names: ["*.jpg"]          # Patterns of image names.
+    server_side_copy: true      # Optional, copy annotations on the server instead of uploading them.
+    seed: 42                    # Optional, the same seed and settings give the same sample.
+    save_manifest: true         # Optional, save the manifest of the sample to the app data and team files.
+    destination:                # Optional, new project and dataset are created if not specified.
+      project_id: null
+      dataset_id: null
+      project_name: null
+      dataset_name: null
+
+The sample saved to the manifest can be uploaded again without indexing the project,
+the manifest is a local path or a path in the team files:
+
+    manifest: /sample-images-from-project/manifests/2024-01-01_12-00-00_12345_42.json
+    destination:
+      dataset_id: 67890
+"""
+
+import argparse
+from typing import List, Optional, Tuple
+
+import supervisely as sly
+import yaml
+
+import src.engine as engine
+import src.filters as filters
+import src.globals as g
+import src.journal as journal
+
+
+def read_config(path: str) -> dict:
+    # JSON is a subset of YAML, so both formats are read the same way.
+    with open(path, "r") as f:
+        config = yaml.safe_load(f)
+
+    validate_config(config, path)
+    return config
+
+
+def validate_config(config: dict, source: str = "job"):
+    if not isinstance(config, dict):
+        raise ValueError(f"Config {source} must contain a mapping with the job settings.")
+    if "manifest" in config:
+        # Source project and settings are taken from the manifest.
+        return
+    filters.SourceFilters.from_config(config.get("filters"))
+    for field in ("project_id", "method"):
+        if field not in config:
+            raise ValueError(f"Field {field} is required in the config {source}.")
+    if "sample_size" not in config and "images_number" not in config:
+        raise ValueError(
+            f"Either sample_size or images_number is required in the config {source}."
+        )
+
+
+def run_job(config: dict) -> Tuple[int, int, int]:
+    """Runs the sampling job with the settings from the config, returns the destination
+    project ID, dataset ID and number of uploaded images."""
+    if "server_side_copy" in config:
+        g.STATE.server_side_copy = bool(config["server_side_copy"])
+    g.STATE.job_name = config.get("name")
+    g.STATE.destination = config.get("destination") or dict()
+
+    if "manifest" in config:
+        samples, job = engine.apply_manifest(config["manifest"])
+        return upload(config, samples, job)
+
+    g.STATE.filters = filters.SourceFilters.from_config(config.get("filters"))
+    engine.load_project(config["project_id"], progress_cb=log_loading_progress)
+    if "seed" in config:
+        g.STATE.fixed_seed = int(config["seed"])
+    if "save_manifest" in config:
+        g.STATE.save_manifest = bool(config["save_manifest"])
+
+    images_number = config.get("images_number")
+    if images_number is not None:
+        # The number of images is used as is, the percentage is kept only for the reports.
+        sample_size = engine.images_number_to_percentage(images_number)
+    else:
+        sample_size = config["sample_size"]
+
+    if engine.plan(
+        config["method"],
+        sample_size,
+        config.get("distribution"),
+        config.get("stratify_by"),
+        config.get("exclude"),
+        images_number,
+    ):
+        sly.logger.warning(
+            "At least one class percentage is more than maximum or less than 0, "
+            f"the distribution was changed to {g.STATE.class_distribution}."
+        )
+
+    samples, job = engine.sample()
+    if not samples:
+        raise RuntimeError(
+            "Could not sample images from the project with the specified parameters."
+        )
+
+    return upload(config, samples, job)
+
+
+def upload(
+    config: dict, samples: List[g.ImageData], job: Optional[journal.Journal]
+) -> Tuple[int, int, int]:
+    destination = config.get("destination") or {}
+    progress = sly.Progress("Uploading images", len(samples))
+    return engine.upload_samples(
+        samples,
+        job,
+        destination.get("project_id"),
+        destination.get("dataset_id"),
+        destination.get("project_name"),
+        destination.get("dataset_name"),
+        progress.iters_done_report,
+    )
+
+
+def log_loading_progress(datasets_done: int, datasets_total: int, images_indexed: int):
+    sly.logger.info(
+        f"Project is being loaded: {datasets_done} of {datasets_total} datasets, "
+        f"{images_indexed} images indexed."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample images from the project without UI.")
+    parser.add_argument("--config", required=True, help="Path to the YAML or JSON job config.")
+    args = parser.parse_args()
+
+    project_id, dataset_id, uploaded = run_job(read_config(args.config))
+    sly.logger.info(
+        f"Uploaded {uploaded} images to the dataset {dataset_id} of the project {project_id}."
+    )
+
+
+if __name__ == "__main__":
+    main()
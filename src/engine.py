@@ -0,0 +1,476 @@
+import secrets
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import supervisely as sly
+
+import src.globals as g
+import src.journal as journal
+import src.manifest as manifest
+import src.sampling as sampling
+import src.upload as upload
+
+# Sample preview is estimated from this number of runs of the sampler with the fixed seed,
+# so the preview doesn't change if the settings are the same. No new runs are started after
+# the time limit in seconds. The range of the preview contains this percent of the runs.
+PREVIEW_RUNS = 20
+PREVIEW_SEED = 0
+PREVIEW_TIME_LIMIT = 1.0
+PREVIEW_INTERVAL = 90
+
+
+def load_project(
+    project_id: int, progress_cb: Optional[Callable[[int, int, int], None]] = None
+):
+    """Loads the project to the state and builds its index."""
+    g.STATE.selected_project = project_id
+    g.STATE.get_project_info(progress_cb=progress_cb)
+
+
+def images_number_to_percentage(images_number: int) -> int:
+    sample_size = int((images_number / g.STATE.total_images_count) * 100)
+    return min(sample_size, 100)
+
+
+def get_images_in_sample(sample_size: int, images_number: Optional[int] = None) -> int:
+    if images_number is not None:
+        return min(images_number, g.STATE.total_images_count)
+
+    return round(sample_size * g.STATE.total_images_count / 100)
+
+
+def calculate_maximum_percentage(sample_size: int, images_number: Optional[int] = None):
+    g.STATE.images_in_sample = get_images_in_sample(sample_size, images_number)
+
+    sly.logger.debug(
+        f"Number of images in the sample with sample size {sample_size}: {g.STATE.images_in_sample}"
+    )
+
+    for class_name, class_dict in g.STATE.class_stats.items():
+        g.STATE.class_stats[class_name]["maximum_percentage"] = to_maximum_percentage(
+            class_dict["total"]
+        )
+
+    sly.logger.debug(
+        f"Maximum percentages for each class was saved in the state: {g.STATE.class_stats}"
+    )
+
+
+def to_maximum_percentage(images_count: int) -> int:
+    """Returns the percentage of the sample which can be filled with this number of images."""
+    if images_count == 0:
+        return 0
+
+    return (
+        round(images_count * 100 / g.STATE.images_in_sample)
+        if g.STATE.images_in_sample > images_count
+        else 100
+    )
+
+
+def get_maximum_percentage(name: str) -> int:
+    """Returns the maximum percentage of the class, the stratum or the expression."""
+    return to_maximum_percentage(g.STATE.count_images(name))
+
+
+def distribute_percentages(num_parts: int) -> List[int]:
+    quotient = 100 // num_parts
+    remainder = 100 % num_parts
+
+    parts = [quotient] * num_parts
+
+    for i in range(remainder):
+        parts[i] += 1
+
+    return parts
+
+
+def get_stratified_distribution(stratify_by: Optional[List[str]] = None) -> Dict[str, float]:
+    """Returns the distribution proportional to the images of the classes or of the strata of the keys,
+    percentages are not rounded, so strata of key combinations don't get 0%."""
+    if stratify_by:
+        images_counts = g.STATE.get_key_strata(stratify_by)
+    else:
+        images_counts = {
+            class_name: g.STATE.count_images(class_name) for class_name in g.STATE.class_stats
+        }
+
+    total_images = sum(images_counts.values())
+    if total_images == 0:
+        raise ValueError(
+            "There are no images to stratify: the images of the project have no classes "
+            "or strata, or all of them are filtered or excluded."
+        )
+
+    return {
+        name: images_count * 100 / total_images for name, images_count in images_counts.items()
+    }
+
+
+def clamp_distribution(class_distribution: Dict[str, float]) -> bool:
+    """Changes percentages which are more than maximum or less than 0 in place.
+    Returns True if at least one percentage was changed."""
+    distribution_changed = False
+    for class_name, class_distribution_value in class_distribution.items():
+        maximum_percentage = get_maximum_percentage(class_name)
+        if class_distribution_value > maximum_percentage:
+            class_distribution[class_name] = maximum_percentage
+            distribution_changed = True
+
+        elif class_distribution_value < 0:
+            class_distribution[class_name] = 0
+            distribution_changed = True
+
+    return distribution_changed
+
+
+def plan(
+    sampling_method: str,
+    sample_size: int,
+    class_distribution: Optional[Dict[str, float]] = None,
+    stratify_by: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    images_number: Optional[int] = None,
+) -> bool:
+    """Saves the sampling settings to the state. Returns True if the custom distribution
+    had percentages out of the range and was changed."""
+    if sampling_method not in g.SAMPLING_METHODS:
+        raise ValueError(
+            f"Unknown sampling method {sampling_method}, "
+            f"available methods: {list(g.SAMPLING_METHODS.keys())}."
+        )
+
+    if sampling_method != "Random" and not g.STATE.index_loaded:
+        # With random streaming the index is built only when it's needed.
+        g.STATE.load_index()
+
+    if exclude and sampling_method == "Random":
+        raise ValueError("Images can be excluded only for the stratified and custom methods.")
+
+    if sampling_method == "Custom" and not class_distribution:
+        raise ValueError("Class distribution must be specified for the custom method.")
+
+    # Unknown classes or strata in the distribution and the exclusions
+    # raise an error before the state is changed.
+    for name in list(class_distribution or []) + list(exclude or []):
+        g.STATE.get_bitmap(name)
+
+    g.STATE.sampling_method = sampling_method
+    g.STATE.exclude = list(exclude or [])
+    if g.STATE.exclude:
+        sly.logger.info(
+            f"{len(g.STATE.get_excluded())} images are excluded by {g.STATE.exclude}."
+        )
+    g.STATE.sample_size = sample_size
+    g.STATE.images_in_sample = get_images_in_sample(sample_size, images_number)
+
+    sly.logger.info(
+        f"Settings locked. Sampling method: {sampling_method}, sample size: {sample_size}"
+    )
+
+    distribution_changed = False
+    if sampling_method == "Custom":
+        calculate_maximum_percentage(sample_size, images_number)
+        g.STATE.class_distribution = dict(class_distribution)
+        sly.logger.info(
+            f"Custom method is selected. Distribution: {g.STATE.class_distribution}"
+        )
+        distribution_changed = clamp_distribution(g.STATE.class_distribution)
+
+    elif sampling_method == "Stratified":
+        g.STATE.class_distribution = get_stratified_distribution(stratify_by)
+
+    else:
+        g.STATE.class_distribution = None
+
+    return distribution_changed
+
+
+def estimate_sample(
+    class_distribution: Dict[str, float], images_in_sample: int
+) -> Tuple[Dict[str, Tuple[float, float, float]], Tuple[float, float, float]]:
+    """Runs the sampler on the index several times and returns (mean, low, high)
+    number of images of each class and in total."""
+    class_names = list(class_distribution.keys())
+    cache_key = (class_names, g.STATE.exclude)
+    if g.STATE.preview_cache is None or g.STATE.preview_cache[0] != cache_key:
+        candidate_ids, incidence = sampling.build_incidence_matrix(
+            g.STATE.get_strata(class_names), class_names
+        )
+        _, name_codes = np.unique(
+            g.STATE.images.names[g.STATE.images.ordinals(candidate_ids)], return_inverse=True
+        )
+        g.STATE.preview_cache = (cache_key, incidence, name_codes)
+    _, incidence, name_codes = g.STATE.preview_cache
+
+    targets = sampling.get_targets(class_distribution, images_in_sample)
+    class_counts, totals = sampling.simulate_stratified_sample(
+        incidence,
+        targets,
+        int(targets.sum()),
+        PREVIEW_RUNS,
+        np.random.default_rng(PREVIEW_SEED),
+        name_codes,
+        PREVIEW_TIME_LIMIT,
+    )
+
+    def summarize(values: np.ndarray) -> Tuple[float, float, float]:
+        low, high = np.percentile(
+            values, [(100 - PREVIEW_INTERVAL) / 2, (100 + PREVIEW_INTERVAL) / 2], axis=0
+        )
+        return values.mean(axis=0), low, high
+
+    means, lows, highs = summarize(class_counts)
+    estimate = {
+        class_name: (float(mean), float(low), float(high))
+        for class_name, mean, low, high in zip(class_names, means, lows, highs)
+    }
+    sly.logger.debug(f"Sample was estimated with {len(totals)} runs of the sampler.")
+
+    return estimate, tuple(float(value) for value in summarize(totals))
+
+
+def prepare_samples() -> List[g.ImageData]:
+    with g.STATE.metrics.stage("sampling") as record:
+        samples = sample_images()
+        record["items"] = len(samples)
+
+    return samples
+
+
+def sample_images() -> List[g.ImageData]:
+    rng = np.random.default_rng(g.STATE.seed)
+
+    if g.STATE.sampling_method == "Random" and not g.STATE.index_loaded:
+        samples = g.STATE.get_random_sample(g.STATE.images_in_sample, rng)
+        sly.logger.debug(
+            f"Random method is selected, {len(samples)} random images was sampled while listing images."
+        )
+        return samples
+
+    if g.STATE.sampling_method == "Random":
+        if g.STATE.images_by_class:
+            # Images with the same name from different datasets are considered duplicates,
+            # only the first of them is kept.
+            image_ids = g.STATE.images.unique_names(
+                np.unique(np.concatenate(list(g.STATE.images_by_class.values())))
+            )
+        else:
+            # Images are stored by their IDs, so they are already unique.
+            image_ids = g.STATE.images.ids
+
+        if len(image_ids) <= g.STATE.images_in_sample:
+            sly.logger.warning(
+                "Filtered images count is less than sample size. "
+                f"Number of filtered images: {len(image_ids)}, sample size: {g.STATE.images_in_sample}. "
+                "This usually happens when the project contains same images in different datasets. "
+            )
+            sampled_ids = image_ids
+        else:
+            sampled_ids = rng.choice(image_ids, size=g.STATE.images_in_sample, replace=False)
+
+        samples = g.STATE.get_samples(sampled_ids)
+        sly.logger.debug(
+            f"Random method is selected, {len(samples)} random images was sampled."
+        )
+
+        return samples
+
+    sampled_ids = sampling.stratified_sample(
+        g.STATE.get_strata(list(g.STATE.class_distribution.keys())),
+        g.STATE.class_distribution,
+        g.STATE.images_in_sample,
+        rng,
+    )
+
+    unique_ids = g.STATE.images.unique_names(sampled_ids)
+    if len(unique_ids) < len(sampled_ids):
+        sly.logger.debug(
+            f"{len(sampled_ids) - len(unique_ids)} images were already sampled "
+            "from another dataset with the same names and were skipped."
+        )
+
+    samples = g.STATE.get_samples(unique_ids)
+    sly.logger.debug(
+        f"Stratified or Custom method is selected, {len(samples)} images was sampled."
+    )
+
+    return samples
+
+
+def sample() -> Tuple[List[g.ImageData], Optional[journal.Journal]]:
+    """Samples images with the settings from the state. If there's an unfinished job with the
+    same settings, its samples and journal are returned instead, otherwise the journal is None.
+    """
+    job = find_unfinished_job()
+    if job is not None:
+        return get_job_samples(job), job
+
+    if g.STATE.fixed_seed is not None:
+        g.STATE.seed = g.STATE.fixed_seed
+    else:
+        g.STATE.seed = secrets.randbits(32)
+    samples = prepare_samples()
+
+    if g.STATE.save_manifest and samples:
+        manifest.save(manifest.build(samples))
+
+    return samples, None
+
+
+def apply_manifest(
+    path: str,
+) -> Tuple[List[g.ImageData], Optional[journal.Journal]]:
+    """Loads the sample from the manifest without indexing the project."""
+    sample_manifest = manifest.load(path)
+    g.STATE.selected_project = sample_manifest["source_project_id"]
+    g.STATE.get_project_info(build_index=False)
+    if g.STATE.project_info.updated_at != sample_manifest["source_updated_at"]:
+        sly.logger.warning(
+            "Source project was updated after the manifest was created, "
+            "images which were removed from the project will be skipped."
+        )
+    manifest.restore_settings(sample_manifest)
+
+    job = find_unfinished_job()
+    if job is not None:
+        return get_job_samples(job), job
+
+    samples = upload.drop_missing_images(manifest.get_samples(sample_manifest))
+    sly.logger.info(f"Sample with {len(samples)} images was loaded from the manifest {path}.")
+    return samples, None
+
+
+def find_unfinished_job() -> Optional[journal.Journal]:
+    job = journal.Journal.load(journal.get_job_key())
+
+    if job is not None and g.api.dataset.get_info_by_id(job.dataset_id) is None:
+        sly.logger.warning(
+            f"Destination dataset with ID {job.dataset_id} of the unfinished job doesn't exist, "
+            "the job will be started from scratch."
+        )
+        job = None
+
+    if job is not None:
+        sly.logger.info(
+            f"Found unfinished job with {len(job.remaining_ids)} of {len(job.sample_ids)} "
+            "images left to upload, it will be resumed."
+        )
+
+    return job
+
+
+def get_job_samples(job: journal.Journal) -> List[g.ImageData]:
+    g.STATE.seed = job.seed
+    samples = [
+        g.ImageData(
+            g.ImageRecord(image_id, dataset_id, None, None),
+            g.STATE.annotations.get(image_id),
+        )
+        for image_id, dataset_id in zip(job.sample_ids, job.sample_dataset_ids)
+    ]
+    # Images which were removed from the source after the job was started are dropped.
+    return upload.drop_missing_images(samples, job.committed_ids)
+
+
+def upload_samples(
+    samples: List[g.ImageData],
+    job: Optional[journal.Journal] = None,
+    project_id: Optional[int] = None,
+    dataset_id: Optional[int] = None,
+    project_name: Optional[str] = None,
+    dataset_name: Optional[str] = None,
+    progress_cb: Optional[Callable[[int], None]] = None,
+) -> Tuple[int, int, int]:
+    """Uploads the samples to the destination, returns the destination project ID,
+    dataset ID and number of uploaded images."""
+    if job is not None:
+        project_id = job.project_id
+        dataset_id = job.dataset_id
+
+    if not project_id:
+        sly.logger.debug("Project ID is not specified, creating a new project.")
+        project_id = create_project(project_name)
+    if not dataset_id:
+        sly.logger.debug("Dataset ID is not specified, creating a new dataset.")
+        dataset_id = create_dataset(project_id, dataset_name)
+
+    if job is None:
+        job = journal.Journal.create(
+            journal.get_job_key(),
+            [image_data.info.id for image_data in samples],
+            [image_data.info.dataset_id for image_data in samples],
+            project_id,
+            dataset_id,
+            g.STATE.seed,
+        )
+
+    committed_count = len(job.committed_ids)
+    error = None
+    try:
+        with g.STATE.metrics.stage("update_meta", items=1):
+            g.api.project.update_meta(project_id, g.STATE.project_meta)
+
+        upload.upload_samples(dataset_id, samples, progress_cb, job)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # The report is saved for failed jobs too, images of this run are counted by the journal.
+        uploaded = len(job.committed_ids) - committed_count
+        save_metrics(project_id, dataset_id, uploaded, error)
+
+    sly.logger.info(
+        f"Sampling is finished. Uploaded {uploaded} images to dataset with ID {dataset_id}."
+    )
+
+    if g.STATE.continue_sampling:
+        job.finish()
+
+    return project_id, dataset_id, uploaded
+
+
+def save_metrics(
+    project_id: int, dataset_id: int, uploaded: int, error: Optional[Exception] = None
+):
+    """Logs the durations of the stages and saves the metrics report of the job
+    to the app data directory."""
+    g.STATE.metrics.log()
+    report_path = g.STATE.metrics.save(
+        g.SLY_APP_DATA_DIR,
+        {
+            "project_id": g.STATE.selected_project,
+            "images_count": g.STATE.total_images_count,
+            "sampling_method": g.STATE.sampling_method,
+            "sample_size": g.STATE.sample_size,
+            "images_in_sample": g.STATE.images_in_sample,
+            "destination_project_id": project_id,
+            "destination_dataset_id": dataset_id,
+            "uploaded": uploaded,
+            "finished": g.STATE.continue_sampling and error is None,
+            "error": None if error is None else repr(error),
+        },
+    )
+    sly.logger.info(f"Metrics of the job were saved to {report_path}.")
+
+
+def create_project(project_name: Optional[str]) -> int:
+    if not project_name:
+        project_name = f"{g.STATE.project_info.name} (sample)"
+
+    workspace_id = g.STATE.selected_workspace or g.STATE.project_info.workspace_id
+    project = g.api.project.create(
+        workspace_id, project_name, change_name_if_conflict=True
+    )
+    return project.id
+
+
+def create_dataset(project_id: int, dataset_name: Optional[str]) -> int:
+    if not dataset_name:
+        dataset_name = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (sample)"
+
+    dataset = g.api.dataset.create(
+        project_id, dataset_name, change_name_if_conflict=True
+    )
+    return dataset.id
@@ -0,0 +1,136 @@
+import hashlib
+import json
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional, Union
+
+import supervisely as sly
+
+FILTER_FIELDS = ("datasets", "exclude_datasets", "tags", "exclude_tags", "names")
+
+
+class SourceFilters:
+    """Filters of the source images which are applied before annotations are downloaded.
+    Datasets are IDs or name patterns, tags are "name" or "name=value"."""
+
+    def __init__(
+        self,
+        datasets: Optional[List[Union[int, str]]] = None,
+        exclude_datasets: Optional[List[Union[int, str]]] = None,
+        tags: Optional[List[str]] = None,
+        exclude_tags: Optional[List[str]] = None,
+        names: Optional[List[str]] = None,
+    ):
+        self.datasets = list(datasets or [])
+        self.exclude_datasets = list(exclude_datasets or [])
+        self.tags = [parse_tag(tag) for tag in tags or []]
+        self.exclude_tags = [parse_tag(tag) for tag in exclude_tags or []]
+        self.names = list(names or [])
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> "SourceFilters":
+        """Creates the filters from the mapping with the fields of FILTER_FIELDS."""
+        config = config or dict()
+        if not isinstance(config, dict):
+            raise ValueError("Source filters must be a mapping.")
+
+        unknown_fields = config.keys() - set(FILTER_FIELDS)
+        if unknown_fields:
+            raise ValueError(
+                f"Unknown source filters: {sorted(unknown_fields)}, available filters: {list(FILTER_FIELDS)}."
+            )
+        for field, value in config.items():
+            if value is not None and not isinstance(value, list):
+                raise ValueError(f"Source filter {field} must be a list.")
+
+        return cls(**config)
+
+    def to_config(self) -> dict:
+        return {
+            "datasets": self.datasets,
+            "exclude_datasets": self.exclude_datasets,
+            "tags": [format_tag(tag) for tag in self.tags],
+            "exclude_tags": [format_tag(tag) for tag in self.exclude_tags],
+            "names": self.names,
+        }
+
+    @property
+    def active(self) -> bool:
+        return any(self.to_config().values())
+
+    @property
+    def filters_images(self) -> bool:
+        return bool(self.tags or self.exclude_tags or self.names)
+
+    def key(self) -> Optional[str]:
+        """Returns the hash of the filters or None if no filters are set."""
+        if not self.active:
+            return None
+
+        return hashlib.sha1(
+            json.dumps(self.to_config(), sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def filter_datasets(self, datasets: List[sly.DatasetInfo]) -> List[sly.DatasetInfo]:
+        return [
+            dataset
+            for dataset in datasets
+            if (not self.datasets or match_dataset(dataset, self.datasets))
+            and not match_dataset(dataset, self.exclude_datasets)
+        ]
+
+    def filter_images(
+        self, image_infos: List[sly.ImageInfo], tag_names: Dict[int, str]
+    ) -> List[sly.ImageInfo]:
+        """Returns the images which pass the filters by tags and names."""
+        if not self.filters_images:
+            return image_infos
+
+        filtered_infos = []
+        for image_info in image_infos:
+            if self.names and not any(
+                fnmatchcase(image_info.name, pattern) for pattern in self.names
+            ):
+                continue
+
+            image_tags = get_image_tags(image_info, tag_names)
+            if not all(match_tag(image_tags, tag) for tag in self.tags):
+                continue
+            if any(match_tag(image_tags, tag) for tag in self.exclude_tags):
+                continue
+
+            filtered_infos.append(image_info)
+
+        return filtered_infos
+
+
+def match_dataset(dataset: sly.DatasetInfo, patterns: List[Union[int, str]]) -> bool:
+    return any(
+        dataset.id == pattern if isinstance(pattern, int) else fnmatchcase(dataset.name, pattern)
+        for pattern in patterns
+    )
+
+
+def parse_tag(tag: str) -> tuple:
+    """Parses "name" or "name=value" to (name, value), value is None if it's not specified."""
+    name, separator, value = str(tag).partition("=")
+    return name.strip(), value.strip() if separator else None
+
+
+def format_tag(tag: tuple) -> str:
+    name, value = tag
+    return name if value is None else f"{name}={value}"
+
+
+def get_image_tags(image_info: sly.ImageInfo, tag_names: Dict[int, str]) -> Dict[str, List[str]]:
+    """Returns tag name -> values of the tag on the image, values are compared as strings."""
+    image_tags = dict()
+    for tag in image_info.tags or []:
+        name = tag.get("name") or tag_names.get(tag.get("tagId"))
+        image_tags.setdefault(name, []).append(str(tag.get("value")))
+
+    return image_tags
+
+
+def match_tag(image_tags: Dict[str, List[str]], tag: tuple) -> bool:
+    name, value = tag
+    return name in image_tags and (value is None or value in image_tags[name])
@@ -1,28 +1,81 @@
+import json
 import os
 from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
+import numpy as np
 import supervisely as sly
+from supervisely.annotation.annotation import AnnotationJsonFields
+from supervisely.annotation.label import LabelJsonFields
 
 from dotenv import load_dotenv
 
+import src.cache as cache
+import src.bitmaps as bitmaps
+import src.filters as filters
+import src.metrics as metrics
+import src.sampling as sampling
+import src.store as store
+
 if sly.is_development():
     load_dotenv("local.env")
     load_dotenv(os.path.expanduser("~/supervisely.env"))
 api = sly.Api.from_env()
 
 SLY_APP_DATA_DIR = sly.app.get_data_dir()
+# Maximum number of datasets which will be fetched from the API at the same time.
+INDEXING_WORKERS = int(os.getenv("INDEXING_WORKERS", 8))
+# Maximum number of batches which will be uploaded to the destination dataset at the same time.
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 4))
+# If True, only class names and objects counts will be kept in memory for each image,
+# full annotations will be downloaded only for the sampled images.
+LIGHTWEIGHT_INDEX = os.getenv("LIGHTWEIGHT_INDEX", "true").lower() in ("true", "1")
+# Bounds of the number of images in one upload batch, the size is adapted to the upload time.
+UPLOAD_BATCH_SIZE_MIN = int(os.getenv("UPLOAD_BATCH_SIZE_MIN", 1))
+UPLOAD_BATCH_SIZE_MAX = int(os.getenv("UPLOAD_BATCH_SIZE_MAX", 500))
+# Maximum size of serialized annotations in one upload batch in bytes.
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_BYTES", 20 * 1024 * 1024))
+# If True, the project index will be saved to the app data directory and reused
+# until the project is updated. Works only with the lightweight index.
+INDEX_CACHE = os.getenv("INDEX_CACHE", "true").lower() in ("true", "1")
+# If True, random sampling will be performed while listing images without building the index,
+# the index will be built only for stratified and custom methods.
+RANDOM_STREAMING = os.getenv("RANDOM_STREAMING", "false").lower() in ("true", "1")
+# If True, annotations of the sampled images will be copied on the server
+# instead of being downloaded and uploaded again by the app.
+SERVER_SIDE_COPY = os.getenv("SERVER_SIDE_COPY", "false").lower() in ("true", "1")
+# Filters of the source images as JSON, e.g. {"datasets": ["2024-*"], "exclude_tags": ["ignore"]},
+# see src/filters.py for the available filters.
+SOURCE_FILTERS = json.loads(os.getenv("SOURCE_FILTERS") or "{}")
+# Seed of the random generator for sampling, if it's not set, a random seed is used for each job.
+SAMPLING_SEED = int(os.getenv("SAMPLING_SEED")) if os.getenv("SAMPLING_SEED") else None
+# If True, the manifest of each sample will be saved to the app data directory and the team files.
+SAVE_MANIFEST = os.getenv("SAVE_MANIFEST", "false").lower() in ("true", "1")
+# Number of images in one page when listing images for random streaming.
+STREAMING_PAGE_SIZE = 10000
 SAMPLING_METHODS = {
     "Random": "Random images will be selected from the project no matter what classes they belong to.",
     "Stratified": "Images will be selected from each class proportionally to the number of images in the class.",
     "Custom": "You can manually set distribution of images for each class.",
 }
 ImageData = namedtuple("ImageData", ["info", "ann"])
+ImageRecord = store.ImageRecord
+
+
+def get_image_classes(ann_json: dict) -> Dict[str, int]:
+    """Counts objects of each class in the annotation JSON without parsing geometries."""
+    image_classes = defaultdict(int)
+    for label_json in ann_json.get(AnnotationJsonFields.LABELS, []):
+        image_classes[label_json[LabelJsonFields.OBJ_CLASS_NAME]] += 1
+
+    return dict(image_classes)
 
 
 class State:
     def __init__(self):
-        self.selected_team = sly.io.env.team_id()
-        self.selected_workspace = sly.io.env.workspace_id()
+        self.selected_team = sly.io.env.team_id(raise_not_found=False)
+        self.selected_workspace = sly.io.env.workspace_id(raise_not_found=False)
         self.selected_project = sly.io.env.project_id(raise_not_found=False)
         self.project_info = None
         self.total_images_count = None
@@ -34,26 +87,132 @@ class State:
         self.images_in_sample = None
         self.class_stats = None
         self.class_distribution = None
+        # Seed of the random generator used for sampling, it's saved in the job journal.
+        self.seed = None
+        # Seed which will be used for the next jobs instead of a random one.
+        self.fixed_seed = SAMPLING_SEED
+        self.save_manifest = SAVE_MANIFEST
+        self.server_side_copy = SERVER_SIDE_COPY
+        # Name and destination of the job, they are a part of the job key, so jobs with
+        # the same settings and different destinations don't share the journal.
+        self.job_name = None
+        self.destination = dict()
+        # Only images which pass the filters are indexed and sampled.
+        self.filters = filters.SourceFilters.from_config(SOURCE_FILTERS)
 
-        self.images_by_class = defaultdict(list)
-        self.images = list()
+        # Class name -> sorted array of unique IDs of images with this class.
+        self.images_by_class = dict()
+        # Class name -> number of objects of this class on each image from images_by_class.
+        self.labels_by_class = dict()
+        # Stratum of the image tag or meta key -> sorted array of IDs of images in this stratum.
+        self.images_by_key = dict()
+        # Class, stratum or set expression of them -> compressed bitmap of ordinals of its images.
+        self.bitmaps = dict()
+        # Classes, strata or expressions whose images are not sampled.
+        self.exclude = []
+        # Compact records of all images in the project, full ImageInfos are not kept in memory.
+        self.images = store.ImageStore.empty()
+        # Image ID -> annotation, only if the lightweight index is disabled.
+        self.annotations = dict()
+        # Numbers of images and objects of the classes in the index.
+        self.class_counts = None
+        # Class names with excluded names, incidence matrix and name codes of rows of the last preview.
+        self.preview_cache = None
+        # Dataset ID -> (updated_at, images count) of the datasets in the index.
+        self.dataset_stamps = dict()
+        self.index_loaded = False
+        # Durations of the stages of the current job, they are saved to the report when it's finished.
+        self.metrics = metrics.Metrics()
 
-    def get_project_info(self):
+    def get_project_info(
+        self,
+        progress_cb: Optional[Callable[[int, int, int], None]] = None,
+        build_index: bool = True,
+    ):
+        """Loads the project info and meta and builds the index unless build_index is False."""
+        self.metrics = metrics.Metrics()
         self.project_info = api.project.get_info_by_id(self.selected_project)
         self.total_images_count = api.project.get_images_count(self.selected_project)
         self.project_meta = sly.ProjectMeta.from_json(
             api.project.get_meta(self.selected_project)
         )
         self.get_project_stats()
-        self.get_images_by_class()
+        self.index_loaded = False
+
+        if not build_index:
+            return
+
+        if RANDOM_STREAMING and self.filters.active:
+            sly.logger.info(
+                "Random streaming is disabled because source filters are set, "
+                "the project will be indexed to count the filtered images."
+            )
+        elif RANDOM_STREAMING:
+            sly.logger.info(
+                "Random streaming is enabled, the project will be indexed only "
+                "if stratified or custom method is selected."
+            )
+            return
+
+        self.load_index(progress_cb)
+
+    def load_index(self, progress_cb: Optional[Callable[[int, int, int], None]] = None):
+        use_cache = INDEX_CACHE and LIGHTWEIGHT_INDEX
+        cache_path = cache.get_cache_path(
+            SLY_APP_DATA_DIR, self.selected_project, self.filters.key()
+        )
+        arrays = None
+        if use_cache:
+            with self.metrics.stage("read_cache"):
+                arrays = cache.load_index(cache_path)
+
+        if arrays is not None and arrays["updated_at"].item() == self.project_info.updated_at:
+            with self.metrics.stage("build_index") as record:
+                self.restore_index(arrays)
+                record["items"] = len(self.images)
+            sly.logger.info(
+                f"Index of the project with {len(self.images)} images was loaded from the cache."
+            )
+        else:
+            # If the project was updated, only changed datasets will be fetched.
+            self.get_images_by_class(previous_index=arrays, progress_cb=progress_cb)
+            if use_cache:
+                with self.metrics.stage("save_cache", items=len(self.images)):
+                    cache.save_index(cache_path, self.project_info.updated_at, self.dump_index())
+
+        self.index_loaded = True
+        if self.filters.active:
+            # Sample size is calculated from the number of filtered images.
+            self.total_images_count = len(self.images)
+            sly.logger.info(f"{len(self.images)} images passed the source filters.")
 
         if not self.images_by_class:
             sly.logger.info(
-                f'Project "{self.project_info.name}" has no classes, will run retrieving function again.'
+                f'Project "{self.project_info.name}" has no classes, only random sampling is available.'
             )
-            self.get_images_by_class(no_class=True)
+
+    def get_random_sample(
+        self, sample_size: int, rng: np.random.Generator
+    ) -> List[ImageData]:
+        """Samples random images while listing the datasets page by page, without building
+        the index and downloading annotations, so the memory usage depends only on the sample size."""
+        def pages():
+            tag_names = self.get_tag_names()
+            datasets = self.filters.filter_datasets(api.dataset.get_list(self.selected_project))
+            for dataset in datasets:
+                for page in api.image.get_list_generator(
+                    dataset.id, batch_size=STREAMING_PAGE_SIZE
+                ):
+                    yield self.filters.filter_images(page, tag_names)
+
+        image_infos = sampling.reservoir_sample(
+            self.metrics.timed_pages("list_images", pages()), sample_size, rng
+        )
+        return [ImageData(image_info, None) for image_info in image_infos]
 
     def get_project_stats(self):
+        """Saves the numbers of objects of each class from the project stats. They are used only
+        until the index is loaded, then they are replaced with the numbers of images."""
         project_stats = api.project.get_stats(self.selected_project)["objects"]["items"]
         class_stats = {}
 
@@ -64,38 +223,358 @@ class State:
         sly.logger.debug(f"Following class stats was saved in the state: {class_stats}")
         self.class_stats = class_stats
 
-    def get_images_by_class(self, no_class: bool = False):
-        dataset_ids = [
-            dataset.id for dataset in api.dataset.get_list(self.selected_project)
+    def get_images_by_class(
+        self,
+        previous_index: Optional[Dict[str, np.ndarray]] = None,
+        progress_cb: Optional[Callable[[int, int, int], None]] = None,
+    ):
+        """Builds the index of the project, unchanged datasets are taken from the previous index."""
+        # Excluded datasets are not listed, so they cost no requests.
+        datasets = self.filters.filter_datasets(api.dataset.get_list(self.selected_project))
+        dataset_stamps = {
+            dataset.id: (dataset.updated_at, dataset.images_count) for dataset in datasets
+        }
+
+        stores = []
+        class_indexes = []
+        key_indexes = []
+        annotations = dict()
+        unchanged_ids = set()
+        if previous_index is not None:
+            previous_stamps = read_dataset_stamps(previous_index)
+            unchanged_ids = {
+                dataset_id
+                for dataset_id, stamp in dataset_stamps.items()
+                if previous_stamps.get(dataset_id) == stamp
+            }
+            previous_images, *previous_class_index, previous_key_index = read_index(
+                previous_index, unchanged_ids
+            )
+            stores.append(previous_images)
+            class_indexes.append(previous_class_index)
+            key_indexes.append(previous_key_index)
+            sly.logger.info(
+                f"{len(unchanged_ids)} datasets were not changed and were taken from the previous index, "
+                f"{len(previous_stamps.keys() - dataset_stamps.keys())} datasets were removed."
+            )
+
+        dataset_ids = [dataset.id for dataset in datasets if dataset.id not in unchanged_ids]
+
+        sly.logger.debug(
+            f"Fetching {len(dataset_ids)} datasets with {INDEXING_WORKERS} workers."
+        )
+
+        # Executor.map yields the results in the order of datasets, so the merged
+        # result is the same as if the datasets were fetched one by one.
+        images_count = sum(len(images) for images in stores)
+        with ThreadPoolExecutor(max_workers=INDEXING_WORKERS) as executor:
+            for datasets_done, (dataset_images, class_index, key_index, dataset_anns) in enumerate(
+                executor.map(self.get_dataset_images, dataset_ids), start=1
+            ):
+                stores.append(dataset_images)
+                class_indexes.append(class_index)
+                key_indexes.append(key_index)
+                annotations.update(dataset_anns)
+                images_count += len(dataset_images)
+
+                if progress_cb is not None:
+                    progress_cb(datasets_done, len(dataset_ids), images_count)
+
+        with self.metrics.stage("build_index", items=images_count):
+            self.set_index(
+                store.ImageStore.concatenate(stores),
+                *store.merge_class_indexes(class_indexes),
+                images_by_key=store.merge_key_indexes(key_indexes),
+                annotations=annotations,
+            )
+        self.dataset_stamps = dataset_stamps
+
+        sly.logger.debug(
+            f"Saved {len(self.images)} images and {len(self.images_by_class)} classes in the state."
+        )
+
+    def set_index(
+        self,
+        images: store.ImageStore,
+        images_by_class: Dict[str, np.ndarray],
+        labels_by_class: Dict[str, np.ndarray],
+        images_by_key: Optional[Dict[str, np.ndarray]] = None,
+        annotations: Optional[Dict[int, sly.Annotation]] = None,
+    ):
+        self.images = images
+        self.images_by_class = images_by_class
+        self.labels_by_class = labels_by_class
+        self.images_by_key = store.limit_key_values(images_by_key or dict())
+        self.annotations = annotations or dict()
+        # Bitmaps of classes and strata are built with the index, bitmaps
+        # of expressions are built when they are requested.
+        self.bitmaps = {
+            name: bitmaps.Bitmap.from_ordinals(images.ordinals(image_ids), len(images))
+            for name, image_ids in {**self.images_by_key, **images_by_class}.items()
+        }
+        self.preview_cache = None
+        self.class_counts = store.count_classes(images_by_class, labels_by_class)
+        self.update_class_stats()
+
+    def update_class_stats(self):
+        """Sets the total of each class to the number of unique images with this class in the
+        index, the number of objects is kept separately. Classes without images stay in the stats."""
+        class_stats = {
+            class_name: {"total": 0, "objects": 0} for class_name in self.class_stats or dict()
+        }
+        for class_name, images_count, objects_count in zip(
+            self.class_counts.class_names,
+            self.class_counts.images_counts.tolist(),
+            self.class_counts.objects_counts.tolist(),
+        ):
+            class_stats[class_name] = {"total": images_count, "objects": objects_count}
+
+        sly.logger.debug(f"Class stats were updated from the index: {class_stats}")
+        self.class_stats = class_stats
+
+    def get_bitmap(self, name: str) -> bitmaps.Bitmap:
+        """Returns the bitmap of the class, the stratum or the set expression of them,
+        e.g. "car & tag:weather=rain" or "pedestrian & !cyclist"."""
+        if name not in self.bitmaps and bitmaps.is_expression(name):
+            self.bitmaps[name] = self.evaluate(name)
+
+        return self.get_named_bitmap(name)
+
+    def get_named_bitmap(self, name: str) -> bitmaps.Bitmap:
+        """Returns the bitmap of the class or the stratum, names are never parsed as expressions."""
+        if name in self.bitmaps:
+            return self.bitmaps[name]
+        if name in self.class_stats or store.get_stratum_key(name) in self.get_keys():
+            # Class or key value without images in the index.
+            return bitmaps.Bitmap.empty(len(self.images))
+
+        raise ValueError(f"Class or stratum {name} doesn't exist in the project.")
+
+    def evaluate(self, expression: str) -> bitmaps.Bitmap:
+        result = bitmaps.Bitmap.empty(len(self.images))
+        for term in bitmaps.parse_expression(expression):
+            # Intersection starts with the smallest set, so the next ones are cheaper.
+            included = sorted(
+                (self.get_named_bitmap(name) for negated, name in term if not negated), key=len
+            )
+            excluded = [self.get_named_bitmap(name) for negated, name in term if negated]
+
+            bitmap = included[0] if included else bitmaps.Bitmap.full(len(self.images))
+            for other in included[1:]:
+                bitmap = bitmap & other
+            for other in excluded:
+                bitmap = bitmap - other
+            result = result | bitmap
+
+        return result
+
+    def get_pool(self, name: str) -> bitmaps.Bitmap:
+        """Returns the bitmap of candidate images for the class, the stratum or the expression
+        without the images which are excluded from the sampling."""
+        if not self.exclude:
+            return self.get_bitmap(name)
+
+        return self.get_bitmap(name) - self.get_excluded()
+
+    def get_excluded(self) -> bitmaps.Bitmap:
+        if not self.exclude:
+            return bitmaps.Bitmap.empty(len(self.images))
+
+        return self.get_bitmap(f" {bitmaps.OR} ".join(self.exclude))
+
+    def get_stratum_ids(self, name: str) -> np.ndarray:
+        """Returns the sorted IDs of candidate images for the class, the stratum or the expression."""
+        if not self.exclude and name in self.images_by_class:
+            return self.images_by_class[name]
+
+        return self.images.ids[self.get_pool(name).ordinals()]
+
+    def get_strata(self, names: List[str]) -> Dict[str, np.ndarray]:
+        """Returns the IDs of images for each class, stratum or expression which has images."""
+        strata = {name: self.get_stratum_ids(name) for name in names}
+        return {name: image_ids for name, image_ids in strata.items() if len(image_ids)}
+
+    def count_images(self, name: str) -> int:
+        if not self.exclude and name in self.class_stats:
+            return self.class_stats[name]["total"]
+
+        return len(self.get_pool(name))
+
+    def get_keys(self) -> List[str]:
+        """Returns the tag and meta keys which have strata in the index."""
+        return list(dict.fromkeys(store.get_stratum_key(stratum) for stratum in self.images_by_key))
+
+    def get_key_strata(self, keys: List[str]) -> Dict[str, int]:
+        """Returns the combinations of values of the keys with the numbers of their images,
+        e.g. "tag:weather=rain & meta:camera=3" for ["tag:weather", "meta:camera"]."""
+        combinations = {"": bitmaps.Bitmap.full(len(self.images)) - self.get_excluded()}
+        for key in keys:
+            strata = [
+                stratum
+                for stratum in self.images_by_key
+                if store.get_stratum_key(stratum) == key and "=" in stratum
+            ] or [stratum for stratum in self.images_by_key if stratum == key]
+            if not strata:
+                raise ValueError(f"Key {key} doesn't exist in the project.")
+
+            combinations = {
+                f"{name} & {stratum}" if name else stratum: bitmap & self.bitmaps[stratum]
+                for name, bitmap in combinations.items()
+                for stratum in strata
+            }
+            # Empty combinations are not combined further.
+            combinations = {name: bitmap for name, bitmap in combinations.items() if len(bitmap)}
+
+        return {name: len(bitmap) for name, bitmap in combinations.items()}
+
+    def get_samples(self, image_ids: np.ndarray) -> List[ImageData]:
+        """Returns the records of the images with their annotations if they are kept in memory."""
+        return [
+            ImageData(record, self.annotations.get(record.id))
+            for record in self.images.get_records(image_ids)
         ]
 
-        for dataset_id in dataset_ids:
+    def dump_index(self) -> Dict[str, np.ndarray]:
+        """Returns the project index as arrays for the cache, classes are stored in CSR format."""
+        class_names = list(self.images_by_class.keys())
+        class_ids = [self.images_by_class[class_name] for class_name in class_names]
+
+        return {
+            "image_ids": self.images.ids,
+            "dataset_ids": self.images.dataset_ids,
+            "names": self.images.names,
+            "hashes": self.images.hashes,
+            "metas": np.array(json.dumps(self.images.metas)),
+            "class_names": np.array(class_names, dtype=str),
+            "class_offsets": np.cumsum(
+                [0] + [len(image_ids) for image_ids in class_ids], dtype=np.int64
+            ),
+            "class_image_ids": np.concatenate(
+                class_ids + [np.array([], dtype=np.int64)]
+            ),
+            "class_labels_counts": np.concatenate(
+                [self.get_labels_counts(class_name) for class_name in class_names]
+                + [np.array([], dtype=np.int64)]
+            ),
+            "key_strata": np.array(list(self.images_by_key.keys()), dtype=str),
+            "key_offsets": np.cumsum(
+                [0] + [len(image_ids) for image_ids in self.images_by_key.values()],
+                dtype=np.int64,
+            ),
+            "key_image_ids": np.concatenate(
+                list(self.images_by_key.values()) + [np.array([], dtype=np.int64)]
+            ),
+            "stamp_dataset_ids": np.array(list(self.dataset_stamps.keys()), dtype=np.int64),
+            "stamp_updated_at": np.array(
+                [updated_at for updated_at, _ in self.dataset_stamps.values()], dtype=str
+            ),
+            "stamp_images_count": np.array(
+                [images_count for _, images_count in self.dataset_stamps.values()],
+                dtype=np.int64,
+            ),
+        }
+
+    def restore_index(self, arrays: Dict[str, np.ndarray]):
+        """Restores the project index from the arrays returned by dump_index."""
+        self.set_index(*read_index(arrays))
+        self.dataset_stamps = read_dataset_stamps(arrays)
+
+    def get_labels_counts(self, class_name: str) -> np.ndarray:
+        """Returns the number of objects of the class on each image from images_by_class[class_name],
+        it can be used as weights for label-weighted sampling."""
+        return self.labels_by_class[class_name]
+
+    def get_tag_names(self) -> Dict[int, str]:
+        return {tag_meta.sly_id: tag_meta.name for tag_meta in self.project_meta.tag_metas}
+
+    def get_dataset_images(
+        self, dataset_id: int
+    ) -> Tuple[
+        store.ImageStore, store.ClassIndex, Dict[str, np.ndarray], Dict[int, sly.Annotation]
+    ]:
+        with self.metrics.stage("list_images") as record:
             image_infos = api.image.get_list(dataset_id)
+            record["items"] = len(image_infos)
+        # Annotations are downloaded only for the images which passed the filters.
+        image_infos = self.filters.filter_images(image_infos, self.get_tag_names())
 
-            anns = [
-                sly.Annotation.from_json(ann_json, self.project_meta)
-                for ann_json in api.annotation.download_json_batch(
-                    dataset_id, [image_info.id for image_info in image_infos]
-                )
-            ]
-
-            for image_info, ann in zip(image_infos, anns):
-                image_data = ImageData(image_info, ann)
-
-                if no_class:
-                    self.images.append(image_data)
-                else:
-                    for label in ann.labels:
-                        self.images_by_class[label.obj_class.name].append(image_data)
-
-        if not no_class:
-            sly.logger.debug(
-                f"Saved {len(self.images_by_class)} (class_name, [(image_id, image_name)]) images in the state."
+        # Bytes are not counted here, serializing the annotations again costs more than parsing them.
+        with self.metrics.stage("download_annotations", items=len(image_infos)):
+            ann_jsons = api.annotation.download_json_batch(
+                dataset_id, [image_info.id for image_info in image_infos]
             )
-        else:
-            sly.logger.debug(
-                f"Saved {len(self.images)} images in the state, since the project has no classes."
+
+        with self.metrics.stage("parse_annotations", items=len(ann_jsons)):
+            image_ids = [image_info.id for image_info in image_infos]
+            class_index = store.group_by_class(
+                image_ids, [get_image_classes(ann_json) for ann_json in ann_jsons]
             )
+            key_index = store.group_by_key(image_infos, self.get_tag_names())
+
+            if LIGHTWEIGHT_INDEX:
+                # Annotations will be downloaded again only for the sampled images.
+                anns = dict()
+            else:
+                anns = {
+                    image_id: sly.Annotation.from_json(ann_json, self.project_meta)
+                    for image_id, ann_json in zip(image_ids, ann_jsons)
+                }
+
+        return store.ImageStore.from_infos(image_infos), class_index, key_index, anns
+
+
+def read_index(
+    arrays: Dict[str, np.ndarray], dataset_ids: Optional[Set[int]] = None
+) -> Tuple[
+    store.ImageStore, Dict[str, np.ndarray], Dict[str, np.ndarray], Dict[str, np.ndarray]
+]:
+    """Reads images, their classes and strata from the arrays of the cached index.
+    If dataset IDs are specified, only images from these datasets are read."""
+    images = store.ImageStore(
+        arrays["image_ids"],
+        arrays["dataset_ids"],
+        arrays["names"],
+        arrays["hashes"],
+        {int(image_id): meta for image_id, meta in json.loads(arrays["metas"].item()).items()},
+    )
+    if dataset_ids is not None:
+        images = images.select(np.isin(images.dataset_ids, list(dataset_ids)))
+
+    images_by_class = dict()
+    labels_by_class = dict()
+    offsets = arrays["class_offsets"]
+    for index, class_name in enumerate(arrays["class_names"].tolist()):
+        start, end = offsets[index], offsets[index + 1]
+        image_ids = arrays["class_image_ids"][start:end]
+        labels_counts = arrays["class_labels_counts"][start:end]
+        if dataset_ids is not None:
+            mask = np.isin(image_ids, images.ids)
+            image_ids, labels_counts = image_ids[mask], labels_counts[mask]
+        if len(image_ids):
+            images_by_class[class_name] = image_ids
+            labels_by_class[class_name] = labels_counts
+
+    images_by_key = dict()
+    offsets = arrays["key_offsets"]
+    for index, stratum in enumerate(arrays["key_strata"].tolist()):
+        image_ids = arrays["key_image_ids"][offsets[index]:offsets[index + 1]]
+        if dataset_ids is not None:
+            image_ids = image_ids[np.isin(image_ids, images.ids)]
+        if len(image_ids):
+            images_by_key[stratum] = image_ids
+
+    return images, images_by_class, labels_by_class, images_by_key
+
+
+def read_dataset_stamps(arrays: Dict[str, np.ndarray]) -> Dict[int, Tuple[str, int]]:
+    return {
+        dataset_id: (updated_at, images_count)
+        for dataset_id, updated_at, images_count in zip(
+            arrays["stamp_dataset_ids"].tolist(),
+            arrays["stamp_updated_at"].tolist(),
+            arrays["stamp_images_count"].tolist(),
+        )
+    }
 
 
 STATE = State()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Iterable, List, Optional
+
+import supervisely as sly
+
+import src.globals as g
+
+JOURNALS_DIR = os.path.join(g.SLY_APP_DATA_DIR, "journals")
+JOB_FILE = "job.json"
+COMMITTED_FILE = "committed.txt"
+
+
+class Journal:
+    """Journal of the sampling job, stored in the app data directory. It contains the IDs of
+    sampled images, the destination project and dataset and the IDs of images which were
+    already uploaded, so the job can be resumed after the app was restarted or stopped.
+    Uploaded images are appended to the journal batch by batch, one line per batch.
+    """
+
+    def __init__(self, job_dir: str, job: dict, committed_ids: set):
+        self.job_dir = job_dir
+        self.job = job
+        self.committed_ids = committed_ids
+
+    @property
+    def sample_ids(self) -> List[int]:
+        return self.job["sample_ids"]
+
+    @property
+    def sample_dataset_ids(self) -> List[int]:
+        return self.job["sample_dataset_ids"]
+
+    @property
+    def project_id(self) -> int:
+        return self.job["project_id"]
+
+    @property
+    def dataset_id(self) -> int:
+        return self.job["dataset_id"]
+
+    @property
+    def seed(self) -> int:
+        return self.job["seed"]
+
+    @property
+    def remaining_ids(self) -> List[int]:
+        return [
+            image_id
+            for image_id in self.sample_ids
+            if image_id not in self.committed_ids
+        ]
+
+    @classmethod
+    def create(
+        cls,
+        job_key: str,
+        sample_ids: List[int],
+        sample_dataset_ids: List[int],
+        project_id: int,
+        dataset_id: int,
+        seed: int,
+    ) -> "Journal":
+        job_dir = os.path.join(JOURNALS_DIR, job_key)
+        sly.fs.mkdir(job_dir, remove_content_if_exists=True)
+
+        job = {
+            "source_project_id": g.STATE.selected_project,
+            "project_id": project_id,
+            "dataset_id": dataset_id,
+            "seed": seed,
+            "sample_ids": sample_ids,
+            "sample_dataset_ids": sample_dataset_ids,
+        }
+        sly.json.dump_json_file(job, os.path.join(job_dir, JOB_FILE), indent=None)
+        open(os.path.join(job_dir, COMMITTED_FILE), "w").close()
+
+        sly.logger.debug(f"Created journal for the job {job_key} in {job_dir}.")
+        return cls(job_dir, job, set())
+
+    @classmethod
+    def load(cls, job_key: str) -> Optional["Journal"]:
+        job_dir = os.path.join(JOURNALS_DIR, job_key)
+        job_path = os.path.join(job_dir, JOB_FILE)
+        if not os.path.isfile(job_path):
+            return None
+
+        try:
+            job = sly.json.load_json_file(job_path)
+        except json.JSONDecodeError:
+            sly.logger.warning(f"Journal {job_path} is corrupted and will be ignored.")
+            return None
+
+        committed_ids = set()
+        committed_path = os.path.join(job_dir, COMMITTED_FILE)
+        if os.path.isfile(committed_path):
+            with open(committed_path, "r") as f:
+                for line in f:
+                    # The last line may be incomplete if the app was killed while writing it.
+                    if line.endswith("\n"):
+                        committed_ids.update(int(image_id) for image_id in line.split())
+
+        sly.logger.debug(
+            f"Loaded journal for the job {job_key}, {len(committed_ids)} of "
+            f"{len(job['sample_ids'])} images were already uploaded."
+        )
+        return cls(job_dir, job, committed_ids)
+
+    def commit(self, image_ids: Iterable[int]):
+        image_ids = list(image_ids)
+        with open(os.path.join(self.job_dir, COMMITTED_FILE), "a") as f:
+            f.write(" ".join(str(image_id) for image_id in image_ids) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.committed_ids.update(image_ids)
+
+    def finish(self):
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+        sly.logger.debug(f"Job is finished, journal {self.job_dir} was removed.")
+
+
+def get_job_key() -> str:
+    """Returns the key of the sampling job, which depends on the source project, the sampling
+    settings and the name and the destination of the job if they are set, so the same job
+    will be resumed and different jobs running at the same time don't share the journal."""
+    settings = {
+        "project_id": g.STATE.selected_project,
+        "project_updated_at": g.STATE.project_info.updated_at,
+        "sampling_method": g.STATE.sampling_method,
+        "images_in_sample": g.STATE.images_in_sample,
+        "class_distribution": g.STATE.class_distribution,
+    }
+    if g.STATE.exclude:
+        settings["exclude"] = g.STATE.exclude
+    if g.STATE.filters.active:
+        settings["filters"] = g.STATE.filters.to_config()
+    if g.STATE.job_name:
+        settings["job_name"] = g.STATE.job_name
+    destination = {key: value for key, value in g.STATE.destination.items() if value}
+    if destination:
+        settings["destination"] = destination
+    return hashlib.sha1(
+        json.dumps(settings, sort_keys=True).encode("utf-8")
+    ).hexdigest()
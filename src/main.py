@@ -9,3 +9,4 @@ import src.ui.output as output
 layout = Container(widgets=[input.card, settings.card, output.card])
 
 app = sly.Application(layout=layout)
+app.get_server().add_event_handler("startup", input.start_background_loading)
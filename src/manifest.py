@@ -0,0 +1,123 @@
+import json
+import os
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import supervisely as sly
+
+import src.filters as filters
+import src.globals as g
+
+MANIFESTS_DIR = os.path.join(g.SLY_APP_DATA_DIR, "manifests")
+TEAM_FILES_DIR = "/sample-images-from-project/manifests"
+MANIFEST_VERSION = 1
+
+
+def build(samples: List[g.ImageData]) -> dict:
+    """Builds the manifest of the sample: the source images, their classes, the seed and the settings."""
+    infos = [image_data.info for image_data in samples]
+    image_ids = np.array([info.id for info in infos], dtype=np.int64)
+
+    class_names = list(g.STATE.images_by_class.keys())
+    image_classes = [[] for _ in infos]
+    for class_index, class_name in enumerate(class_names):
+        in_class = np.isin(image_ids, g.STATE.images_by_class[class_name])
+        for position in np.flatnonzero(in_class).tolist():
+            image_classes[position].append(class_index)
+
+    return {
+        "version": MANIFEST_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "source_project_id": g.STATE.selected_project,
+        "source_updated_at": g.STATE.project_info.updated_at,
+        "seed": g.STATE.seed,
+        "settings": {
+            "sampling_method": g.STATE.sampling_method,
+            "sample_size": g.STATE.sample_size,
+            "images_in_sample": g.STATE.images_in_sample,
+            "class_distribution": g.STATE.class_distribution,
+            "filters": g.STATE.filters.to_config(),
+            "exclude": g.STATE.exclude,
+        },
+        "class_names": class_names,
+        "images": {
+            "ids": image_ids.tolist(),
+            "dataset_ids": [info.dataset_id for info in infos],
+            "names": [info.name for info in infos],
+            "hashes": [info.hash for info in infos],
+            "classes": image_classes,
+        },
+    }
+
+
+def save(manifest: dict) -> str:
+    """Saves the manifest to the app data directory and uploads it to the team files
+    if the team is known. Returns the path of the manifest in the team files or the
+    local path if it was not uploaded."""
+    name = (
+        f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_"
+        f"{manifest['source_project_id']}_{manifest['seed']}.json"
+    )
+    sly.fs.mkdir(MANIFESTS_DIR)
+    local_path = os.path.join(MANIFESTS_DIR, name)
+    with open(local_path, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    sly.logger.info(
+        f"Manifest of the sample with {len(manifest['images']['ids'])} images was saved to {local_path}."
+    )
+
+    if not g.STATE.selected_team:
+        sly.logger.warning("Team is not specified, the manifest was not uploaded to the team files.")
+        return local_path
+
+    remote_path = f"{TEAM_FILES_DIR}/{name}"
+    g.api.file.upload(g.STATE.selected_team, local_path, remote_path)
+    sly.logger.info(f"Manifest was uploaded to the team files: {remote_path}.")
+    return remote_path
+
+
+def load(path: str) -> dict:
+    """Loads the manifest from the local path or from the path in the team files."""
+    if not os.path.isfile(path):
+        if not g.STATE.selected_team or not g.api.file.exists(g.STATE.selected_team, path):
+            raise ValueError(f"Manifest {path} was not found locally or in the team files.")
+
+        local_path = os.path.join(MANIFESTS_DIR, os.path.basename(path))
+        sly.fs.mkdir(MANIFESTS_DIR)
+        g.api.file.download(g.STATE.selected_team, path, local_path)
+        path = local_path
+
+    with open(path, "r") as f:
+        manifest = json.load(f)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(
+            f"Manifest {path} has version {manifest.get('version')}, "
+            f"only version {MANIFEST_VERSION} is supported."
+        )
+
+    return manifest
+
+
+def restore_settings(manifest: dict):
+    """Sets the sampling settings and the seed of the manifest to the state."""
+    settings = manifest["settings"]
+    g.STATE.sampling_method = settings["sampling_method"]
+    g.STATE.sample_size = settings["sample_size"]
+    g.STATE.images_in_sample = settings["images_in_sample"]
+    g.STATE.class_distribution = settings["class_distribution"]
+    g.STATE.filters = filters.SourceFilters.from_config(settings.get("filters"))
+    g.STATE.exclude = settings.get("exclude", [])
+    g.STATE.seed = manifest["seed"]
+
+
+def get_samples(manifest: dict) -> List[g.ImageData]:
+    """Returns the images of the manifest as minimal records."""
+    images = manifest["images"]
+    return [
+        g.ImageData(g.ImageRecord(image_id, dataset_id, name, image_hash), None)
+        for image_id, dataset_id, name, image_hash in zip(
+            images["ids"], images["dataset_ids"], images["names"], images["hashes"]
+        )
+    ]
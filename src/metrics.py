@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional
+
+import supervisely as sly
+
+METRICS_DIR = "metrics"
+
+
+class Metrics:
+    """Durations, items and bytes of the stages of the sampling job. Stages can run in several
+    threads at the same time, so for each stage both the sum of durations in all threads and
+    the wall time from the start of the first call to the end of the last call are recorded.
+    Throughput of the stage is calculated from its wall time.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.stages = dict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0, size: int = 0):
+        """Measures the duration of the code in the context. Items and bytes can be
+        specified here or added to the returned record inside the context."""
+        record = {"items": items, "bytes": size}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.add(name, start, time.perf_counter(), record["items"], record["bytes"])
+
+    def add(self, name: str, start: float, end: float, items: int = 0, size: int = 0):
+        with self._lock:
+            stage = self.stages.setdefault(
+                name,
+                {"calls": 0, "duration": 0.0, "items": 0, "bytes": 0, "start": start, "end": end},
+            )
+            stage["calls"] += 1
+            stage["duration"] += end - start
+            stage["items"] += items
+            stage["bytes"] += size
+            stage["start"] = min(stage["start"], start)
+            stage["end"] = max(stage["end"], end)
+
+    def timed_pages(self, name: str, pages: Iterable[List]) -> Iterator[List]:
+        """Yields the pages and measures the time of fetching each of them."""
+        pages = iter(pages)
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            self.add(name, start, time.perf_counter(), len(page))
+            yield page
+
+    def report(self) -> dict:
+        stages = dict()
+        for name, stage in self.stages.items():
+            wall_time = stage["end"] - stage["start"]
+            stages[name] = {
+                "calls": stage["calls"],
+                "duration": round(stage["duration"], 4),
+                "wall_time": round(wall_time, 4),
+                "items": stage["items"],
+                "bytes": stage["bytes"],
+                "images_per_second": round(stage["items"] / wall_time, 2) if wall_time > 0 else None,
+            }
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now().isoformat(),
+            "total_duration": round((datetime.now() - self.started_at).total_seconds(), 4),
+            "stages": stages,
+        }
+
+    def log(self):
+        for name, stage in self.report()["stages"].items():
+            sly.logger.info(
+                f"Stage {name}: {stage['items']} items, {stage['bytes']} bytes in {stage['wall_time']} s "
+                f"({stage['images_per_second']} images/s, {stage['calls']} calls).",
+                extra={"stage": name, **stage},
+            )
+
+    def save(self, data_dir: str, job_info: dict) -> str:
+        """Saves the report with the job information to the metrics directory
+        in the app data directory and returns the path of the report."""
+        report = {**job_info, **self.report()}
+        metrics_dir = os.path.join(data_dir, METRICS_DIR)
+        sly.fs.mkdir(metrics_dir)
+        path = os.path.join(
+            metrics_dir,
+            f"{self.started_at.strftime('%Y-%m-%d_%H-%M-%S-%f')}_{job_info.get('project_id')}.json",
+        )
+        with open(path, "w") as f:
+            json.dump(report, f, indent=4)
+
+        return path
+
+
+def json_size(data) -> int:
+    """Returns the size of the data serialized to compact JSON."""
+    return len(json.dumps(data, separators=(",", ":")))
+
+
+class Throughput:
+    """Tracks the number of processed items and estimates the remaining time."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    def update(self, count: int):
+        self.done += count
+
+    @property
+    def images_per_second(self) -> Optional[float]:
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 and self.done else None
+
+    @property
+    def eta(self) -> Optional[float]:
+        speed = self.images_per_second
+        return (self.total - self.done) / speed if speed else None
+
+    def format(self) -> str:
+        speed = self.images_per_second
+        if speed is None:
+            return "Estimating speed..."
+        minutes, seconds = divmod(round(self.eta), 60)
+        return f"{speed:.1f} images/s, {minutes} min {seconds} s left"
@@ -0,0 +1,228 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import numpy as np
+import supervisely as sly
+
+T = TypeVar("T")
+
+# Iterative stratification selects the images in about this number of steps, the capacity
+# of each step is split between the classes in proportion to their demand.
+STRATIFICATION_STEPS = 50
+
+
+def stratified_sample(
+    images_by_class: Dict[str, np.ndarray],
+    class_distribution: Dict[str, float],
+    images_in_sample: int,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Samples images according to the distribution of classes in percents,
+    returns the unique IDs of sampled images."""
+    class_names = list(class_distribution.keys())
+    targets = get_targets(class_distribution, images_in_sample)
+    for class_name in class_names:
+        if class_name not in images_by_class:
+            sly.logger.warning(f"There are no images of class {class_name} in the project.")
+
+    candidate_ids, incidence = build_incidence_matrix(images_by_class, class_names)
+    rows = iterative_stratification(incidence, targets, int(targets.sum()), rng)
+
+    return candidate_ids[rows]
+
+
+def get_targets(class_distribution: Dict[str, float], images_in_sample: int) -> np.ndarray:
+    """Splits the images of the sample between the classes in proportion to their percentages
+    with the largest remainders, so the targets add up to the sample even for many small shares."""
+    percentages = np.maximum(np.array(list(class_distribution.values()), dtype=np.float64), 0)
+    return split_proportionally(round(images_in_sample * percentages.sum() / 100), percentages)
+
+
+def build_incidence_matrix(
+    images_by_class: Dict[str, np.ndarray], class_names: List[str]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the IDs of images with any of the classes and the image x class matrix."""
+    empty = np.array([], dtype=np.int64)
+    class_ids = [images_by_class.get(class_name, empty) for class_name in class_names]
+    candidate_ids = np.unique(np.concatenate(class_ids + [empty]))
+
+    incidence = np.zeros((len(candidate_ids), len(class_names)), dtype=bool, order="F")
+    for column, image_ids in enumerate(class_ids):
+        incidence[np.searchsorted(candidate_ids, image_ids), column] = True
+
+    return candidate_ids, incidence
+
+
+def iterative_stratification(
+    incidence: np.ndarray,
+    targets: np.ndarray,
+    sample_size: int,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Selects rows of the incidence matrix, so the number of selected images of each class
+    is as close to its target as possible (iterative stratification for multi-label data)."""
+    if rng is None:
+        rng = np.random.default_rng()
+
+    targets = targets.astype(np.int64)
+    counts = np.zeros_like(targets)
+    supply = np.count_nonzero(incidence, axis=0)
+    available = np.ones(len(incidence), dtype=bool)
+    # Images with other classes are avoided, so each image counts for as few classes as possible.
+    # Random priority of each image breaks the ties, but doesn't change the order of penalties.
+    others = np.count_nonzero(incidence, axis=1) - 1
+    penalties = others + rng.random(len(incidence))
+    class_rows = [np.flatnonzero(incidence[:, column]) for column in range(incidence.shape[1])]
+    # Images without other classes have the lowest penalties, they are kept in the order of
+    # their priorities, so usually the images of the class are taken from them without sorting.
+    single_rows = []
+    for rows in class_rows:
+        rows = rows[others[rows] == 0]
+        single_rows.append(rows[np.argsort(penalties[rows])])
+    satisfied_penalties = np.zeros(len(incidence), dtype=np.int64)
+    satisfied = np.zeros(len(targets), dtype=bool)
+    selected = []
+    taken = 0
+    scale = 1.0
+
+    sample_size = min(sample_size, len(incidence))
+    step_size = max(1, -(-sample_size // STRATIFICATION_STEPS))
+
+    while taken < sample_size:
+        demand = np.where(supply > 0, np.ceil(targets * scale).astype(np.int64) - counts, 0)
+        if not (demand > 0).any() and taken > 0:
+            # Targets are reached with fewer images because multi-label images count for
+            # several classes, targets are scaled up to fill the sample with the same proportions.
+            scale *= sample_size / taken
+            demand = np.where(supply > 0, np.ceil(targets * scale).astype(np.int64) - counts, 0)
+            sly.logger.debug(f"Class targets were reached with {taken} images, scaled them by {scale:.3f}.")
+        if not (demand > 0).any():
+            break
+
+        # The step is split between the classes in proportion to their demand,
+        # so no class can use up the capacity which is left for the others.
+        quotas = split_proportionally(min(step_size, sample_size - taken), np.maximum(demand, 0))
+        columns = np.flatnonzero(quotas)
+        # The rarest class goes first, so more common classes can't use up its images.
+        for column in columns[np.argsort(supply[columns], kind="stable")]:
+            if not np.array_equal(satisfied, demand <= 0):
+                # Classes which already have enough images are avoided the most.
+                satisfied = demand <= 0
+                satisfied_penalties = np.count_nonzero(incidence[:, satisfied], axis=1)
+
+            # Rows of the taken images are dropped, so the lists get shorter with each step.
+            single_rows[column] = single_rows[column][available[single_rows[column]]]
+            class_rows[column] = class_rows[column][available[class_rows[column]]]
+            rows = class_rows[column]
+            images_number = min(quotas[column], demand[column], len(rows))
+            if images_number <= 0:
+                continue
+
+            if images_number <= len(single_rows[column]):
+                rows = single_rows[column][:images_number]
+            elif images_number < len(rows):
+                keys = penalties[rows] + satisfied_penalties[rows]
+                rows = rows[np.argpartition(keys, images_number - 1)[:images_number]]
+
+            chosen_counts = np.count_nonzero(incidence[rows], axis=0)
+            demand -= chosen_counts
+            supply -= chosen_counts
+            counts += chosen_counts
+            available[rows] = False
+            selected.append(rows)
+            taken += images_number
+
+    if taken < sample_size:
+        # Classes which need images have no more available images.
+        rest = np.flatnonzero(available)
+        images_number = min(sample_size - taken, len(rest))
+        selected.append(rng.choice(rest, size=images_number, replace=False))
+        sly.logger.debug(
+            f"There are no more images of classes which need them, "
+            f"{images_number} random images were added to fill the sample."
+        )
+
+    if not selected:
+        return np.array([], dtype=np.int64)
+    return np.concatenate(selected)
+
+
+def split_proportionally(total: int, weights: np.ndarray) -> np.ndarray:
+    """Splits the total into integer parts proportional to the weights with the largest remainders."""
+    if total <= 0 or weights.sum() <= 0:
+        return np.zeros(len(weights), dtype=np.int64)
+
+    shares = total * weights / weights.sum()
+    parts = np.floor(shares).astype(np.int64)
+    remainder = total - parts.sum()
+    if remainder > 0:
+        parts[np.argsort(parts - shares, kind="stable")[:remainder]] += 1
+
+    return parts
+
+
+def simulate_stratified_sample(
+    incidence: np.ndarray,
+    targets: np.ndarray,
+    sample_size: int,
+    runs: int,
+    rng: Optional[np.random.Generator] = None,
+    name_codes: Optional[np.ndarray] = None,
+    time_limit: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Runs iterative stratification several times, returns the numbers of images
+    of each class and the total number of images in each run."""
+    if rng is None:
+        rng = np.random.default_rng()
+
+    start = time.perf_counter()
+    class_counts = []
+    totals = []
+    for _ in range(runs):
+        rows = iterative_stratification(incidence, targets, sample_size, rng)
+        if name_codes is not None:
+            _, first_indices = np.unique(name_codes[rows], return_index=True)
+            rows = rows[first_indices]
+
+        class_counts.append(np.count_nonzero(incidence[rows], axis=0))
+        totals.append(len(rows))
+
+        if time_limit is not None and time.perf_counter() - start > time_limit:
+            break
+
+    return np.array(class_counts), np.array(totals)
+
+
+def reservoir_sample(
+    pages: Iterable[List[T]], sample_size: int, rng: Optional[np.random.Generator] = None
+) -> List[T]:
+    """Samples items uniformly from the stream of pages with reservoir sampling."""
+    if rng is None:
+        rng = np.random.default_rng()
+
+    reservoir = []
+    seen = 0
+
+    for page in pages:
+        # Filling the reservoir with the first items.
+        start = min(sample_size - len(reservoir), len(page))
+        reservoir.extend(page[:start])
+        seen += start
+
+        rest = len(page) - start
+        if rest <= 0:
+            continue
+
+        # The item with index t replaces a random slot in [0, t] if the slot is in the reservoir.
+        slots = rng.integers(0, np.arange(seen + 1, seen + rest + 1))
+        replacing = np.flatnonzero(slots < sample_size)
+
+        # Later items of the page must overwrite earlier ones in the same slot.
+        _, last = np.unique(slots[replacing][::-1], return_index=True)
+        for position in replacing[::-1][last].tolist():
+            reservoir[slots[position]] = page[start + position]
+
+        seen += rest
+
+    sly.logger.debug(f"Sampled {len(reservoir)} of {seen} items from the stream.")
+    return reservoir
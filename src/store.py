@@ -0,0 +1,261 @@
+from collections import defaultdict, namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import supervisely as sly
+
+# Minimal information about the image which is kept in the index, full ImageInfo
+# for such images will be requested from the API only before uploading.
+ImageRecord = namedtuple("ImageRecord", ["id", "dataset_id", "name", "hash"])
+
+# Class name -> sorted array of IDs of images with this class and class name -> number of
+# objects of this class on each of these images.
+ClassIndex = Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]
+
+# Stratification keys are image tags and fields of image metas. Each value of the key is
+# a stratum: "tag:weather=rain" for images with the tag value, "tag:reviewed" for images with
+# the tag and "meta:camera=3" for images with the meta field value.
+TAG_PREFIX = "tag:"
+META_PREFIX = "meta:"
+# Keys with more values are not used for stratification, e.g. meta fields with unique values.
+MAX_KEY_VALUES = 100
+
+# Numbers of unique images and objects of each class.
+ClassCounts = namedtuple("ClassCounts", ["class_names", "images_counts", "objects_counts"])
+
+
+class ImageStore:
+    """Columnar store of the images of the project, images are sorted by ID
+    and their positions are used as image ordinals."""
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        dataset_ids: np.ndarray,
+        names: np.ndarray,
+        hashes: np.ndarray,
+        metas: Optional[Dict[int, dict]] = None,
+    ):
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order].astype(np.int64, copy=False)
+        self.dataset_ids = dataset_ids[order].astype(np.int64, copy=False)
+        self.names = names[order]
+        self.hashes = hashes[order]
+        self.metas = metas or dict()
+
+    @classmethod
+    def empty(cls) -> "ImageStore":
+        return cls(
+            np.array([], dtype=np.int64),
+            np.array([], dtype=np.int64),
+            np.array([], dtype=bytes),
+            np.array([], dtype=bytes),
+        )
+
+    @classmethod
+    def from_infos(cls, infos: List[sly.ImageInfo]) -> "ImageStore":
+        return cls(
+            np.array([info.id for info in infos], dtype=np.int64),
+            np.array([info.dataset_id for info in infos], dtype=np.int64),
+            np.array([info.name.encode() for info in infos], dtype=bytes),
+            np.array([(info.hash or "").encode() for info in infos], dtype=bytes),
+            {info.id: info.meta for info in infos if info.meta},
+        )
+
+    @classmethod
+    def concatenate(cls, stores: Iterable["ImageStore"]) -> "ImageStore":
+        stores = [cls.empty()] + list(stores)
+        metas = dict()
+        for store in stores:
+            metas.update(store.metas)
+
+        return cls(
+            np.concatenate([store.ids for store in stores]),
+            np.concatenate([store.dataset_ids for store in stores]),
+            np.concatenate([store.names for store in stores]),
+            np.concatenate([store.hashes for store in stores]),
+            metas,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(self, mask: np.ndarray) -> "ImageStore":
+        ids = self.ids[mask]
+        return ImageStore(
+            ids,
+            self.dataset_ids[mask],
+            self.names[mask],
+            self.hashes[mask],
+            {image_id: self.metas[image_id] for image_id in ids.tolist() if image_id in self.metas},
+        )
+
+    def ordinals(self, image_ids: np.ndarray) -> np.ndarray:
+        """Returns the positions of the images in the store, all images must be in the store."""
+        return np.searchsorted(self.ids, image_ids)
+
+    def get_records(self, image_ids: np.ndarray) -> List[ImageRecord]:
+        ordinals = self.ordinals(image_ids)
+        return [
+            ImageRecord(image_id, dataset_id, name.decode(), image_hash.decode() or None)
+            for image_id, dataset_id, name, image_hash in zip(
+                self.ids[ordinals].tolist(),
+                self.dataset_ids[ordinals].tolist(),
+                self.names[ordinals].tolist(),
+                self.hashes[ordinals].tolist(),
+            )
+        ]
+
+    def get_meta(self, image_id: int) -> dict:
+        return self.metas.get(image_id, dict())
+
+    def unique_names(self, image_ids: np.ndarray) -> np.ndarray:
+        """Returns the images without duplicates by name in the same order. Of the images with
+        the same name only the first one is kept."""
+        _, first_indices = np.unique(
+            self.names[self.ordinals(image_ids)], return_index=True
+        )
+        return image_ids[np.sort(first_indices)]
+
+
+def group_by_class(
+    image_ids: List[int], image_classes: List[Dict[str, int]]
+) -> ClassIndex:
+    """Builds the class index from the numbers of objects of each class on each image."""
+    ids_by_class = defaultdict(list)
+    labels_by_class = defaultdict(list)
+    for image_id, classes in zip(image_ids, image_classes):
+        # Each image is stored only once per class, no matter how many
+        # objects of this class it has.
+        for class_name, labels_count in classes.items():
+            ids_by_class[class_name].append(image_id)
+            labels_by_class[class_name].append(labels_count)
+
+    return sort_class_index(
+        {class_name: np.array(ids, dtype=np.int64) for class_name, ids in ids_by_class.items()},
+        {
+            class_name: np.array(counts, dtype=np.int64)
+            for class_name, counts in labels_by_class.items()
+        },
+    )
+
+
+def merge_class_indexes(class_indexes: List[ClassIndex]) -> ClassIndex:
+    """Merges the class indexes of different datasets, images must not repeat."""
+    empty = np.array([], dtype=np.int64)
+    class_names = dict.fromkeys(
+        class_name for images_by_class, _ in class_indexes for class_name in images_by_class
+    )
+
+    return sort_class_index(
+        {
+            class_name: np.concatenate(
+                [images_by_class.get(class_name, empty) for images_by_class, _ in class_indexes]
+            )
+            for class_name in class_names
+        },
+        {
+            class_name: np.concatenate(
+                [labels_by_class.get(class_name, empty) for _, labels_by_class in class_indexes]
+            )
+            for class_name in class_names
+        },
+    )
+
+
+def sort_class_index(
+    images_by_class: Dict[str, np.ndarray], labels_by_class: Dict[str, np.ndarray]
+) -> ClassIndex:
+    for class_name, image_ids in images_by_class.items():
+        order = np.argsort(image_ids, kind="stable")
+        images_by_class[class_name] = image_ids[order]
+        labels_by_class[class_name] = labels_by_class[class_name][order]
+
+    return images_by_class, labels_by_class
+
+
+def count_classes(
+    images_by_class: Dict[str, np.ndarray], labels_by_class: Dict[str, np.ndarray]
+) -> ClassCounts:
+    """Counts images and objects of the classes from the class index."""
+    class_names = list(images_by_class.keys())
+    images_counts = np.array(
+        [len(images_by_class[class_name]) for class_name in class_names], dtype=np.int64
+    )
+    objects_counts = np.array(
+        [labels_by_class[class_name].sum() for class_name in class_names], dtype=np.int64
+    )
+
+    return ClassCounts(class_names, images_counts, objects_counts)
+
+
+def get_image_strata(image_info: sly.ImageInfo, tag_names: Dict[int, str]) -> List[str]:
+    """Returns the strata of the image by its tags and scalar fields of its meta."""
+    strata = set()
+    for tag in image_info.tags or []:
+        name = tag.get("name") or tag_names.get(tag.get("tagId"))
+        strata.add(f"{TAG_PREFIX}{name}")
+        if tag.get("value") is not None:
+            strata.add(f"{TAG_PREFIX}{name}={tag['value']}")
+
+    for field, value in (image_info.meta or dict()).items():
+        if isinstance(value, (str, int, float, bool)):
+            strata.add(f"{META_PREFIX}{field}={value}")
+
+    return list(strata)
+
+
+def group_by_key(
+    image_infos: List[sly.ImageInfo], tag_names: Dict[int, str]
+) -> Dict[str, np.ndarray]:
+    """Builds the key index: stratum -> sorted array of IDs of images in this stratum."""
+    ids_by_stratum = defaultdict(list)
+    for image_info in image_infos:
+        for stratum in get_image_strata(image_info, tag_names):
+            ids_by_stratum[stratum].append(image_info.id)
+
+    return {
+        stratum: np.sort(np.array(ids, dtype=np.int64))
+        for stratum, ids in ids_by_stratum.items()
+    }
+
+
+def merge_key_indexes(key_indexes: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Merges the key indexes of different datasets, images must not repeat."""
+    empty = np.array([], dtype=np.int64)
+    strata = dict.fromkeys(stratum for key_index in key_indexes for stratum in key_index)
+    return {
+        stratum: np.sort(
+            np.concatenate([key_index.get(stratum, empty) for key_index in key_indexes])
+        )
+        for stratum in strata
+    }
+
+
+def get_stratum_key(stratum: str) -> str:
+    """Returns the key of the stratum, e.g. "tag:weather" for "tag:weather=rain"."""
+    return stratum.partition("=")[0]
+
+
+def limit_key_values(
+    images_by_key: Dict[str, np.ndarray], max_values: int = MAX_KEY_VALUES
+) -> Dict[str, np.ndarray]:
+    """Removes the values of keys which have more than max_values values,
+    the strata of presence of tags without values are kept."""
+    values_counts = defaultdict(int)
+    for stratum in images_by_key:
+        if "=" in stratum:
+            values_counts[get_stratum_key(stratum)] += 1
+
+    removed_keys = {key for key, count in values_counts.items() if count > max_values}
+    if removed_keys:
+        sly.logger.info(
+            f"Keys {sorted(removed_keys)} have more than {max_values} values "
+            "and will not be used for stratification."
+        )
+
+    return {
+        stratum: image_ids
+        for stratum, image_ids in images_by_key.items()
+        if "=" not in stratum or get_stratum_key(stratum) not in removed_keys
+    }
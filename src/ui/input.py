@@ -1,15 +1,20 @@
 import os
+import threading
 
 import supervisely as sly
+import yaml
 from supervisely.app.widgets import (
     Card,
     SelectProject,
     Button,
     Container,
+    Editor,
+    Field,
     ProjectThumbnail,
     Text,
 )
 
+import src.filters as filters
 import src.globals as g
 import src.ui.settings as settings
 
@@ -22,12 +27,43 @@ load_button = Button("Load data")
 change_project_button = Button("Change project", icon="zmdi zmdi-lock-open")
 change_project_button.hide()
 
+filters_editor = Editor(
+    initial_text=(
+        yaml.safe_dump(g.STATE.filters.to_config(), sort_keys=False)
+        if g.STATE.filters.active
+        else (
+            "# Uncomment the filters to sample only a part of the project.\n"
+            "# datasets: ['2024-*']  # IDs or name patterns of datasets.\n"
+            "# exclude_datasets: []\n"
+            "# tags: ['reviewed', 'split=train']  # Images must have all of these tags.\n"
+            "# exclude_tags: ['ignore']  # Images with any of these tags are skipped.\n"
+            "# names: ['*.jpg']  # Patterns of image names.\n"
+        )
+    ),
+    language_mode="yaml",
+    height_lines=8,
+)
+filters_field = Field(
+    title="Source filters",
+    description=(
+        "Only images which pass the filters will be loaded and sampled, "
+        "annotations of other images are not downloaded."
+    ),
+    content=filters_editor,
+)
+
+filters_error_text = Text(status="warning")
+filters_error_text.hide()
+
 no_project_message = Text(
     "Please, select a project before clicking the button.",
     status="warning",
 )
 no_project_message.hide()
 
+loading_text = Text(status="info")
+loading_text.hide()
+
 
 def no_class_handler():
     if not g.STATE.class_stats:
@@ -39,18 +75,16 @@ def no_class_handler():
 
 if g.STATE.selected_project:
     # If the app was loaded from a project.
+    # The project will be loaded in the background after the server is started.
     sly.logger.debug("App was loaded from a project.")
 
     select_project.hide()
+    # Filters can be set only with the SOURCE_FILTERS variable in this case.
+    filters_field.hide()
     load_button.hide()
 
-    g.STATE.get_project_info()
-    no_class_handler()
-    project_thumbnail.set(g.STATE.project_info)
-    project_thumbnail.show()
-
-    settings.card.unlock()
-    settings.card.uncollapse()
+    loading_text.text = "Project is being loaded..."
+    loading_text.show()
 else:
     sly.logger.debug("App was loaded from ecosystem.")
 
@@ -62,8 +96,11 @@ card = Card(
         widgets=[
             project_thumbnail,
             select_project,
+            filters_field,
+            filters_error_text,
             load_button,
             no_project_message,
+            loading_text,
         ]
     ),
     content_top_right=change_project_button,
@@ -87,26 +124,74 @@ def load_project():
     # Hide the warning message if project was selected.
     no_project_message.hide()
 
+    try:
+        g.STATE.filters = filters.SourceFilters.from_config(
+            yaml.safe_load(filters_editor.get_text())
+        )
+    except (yaml.YAMLError, ValueError) as e:
+        filters_error_text.text = f"Source filters are incorrect: {e}"
+        filters_error_text.show()
+        return
+    filters_error_text.hide()
+
     # Changing the values of the global variables to access them from other modules.
     g.STATE.selected_project = project_id
 
     # Disabling the project selector and the load button.
     select_project.disable()
+    filters_editor.disable()
     load_button.hide()
 
     # Showing the lock checkbox for unlocking the project selector and button.
     change_project_button.show()
 
-    g.STATE.get_project_info()
+    load_project_data()
+
+    card.lock()
+
+
+def start_background_loading():
+    """Starts loading of the project in the background thread, so the server
+    can serve the UI while the project is being indexed."""
+    if not g.STATE.selected_project or g.STATE.project_info is not None:
+        return
+
+    threading.Thread(target=load_project_in_background, daemon=True).start()
+
+
+def load_project_in_background():
+    try:
+        load_project_data()
+    except Exception as e:
+        sly.logger.error(f"Failed to load the project: {e}", exc_info=True)
+        loading_text.text = f"Failed to load the project: {e}"
+        loading_text.status = "error"
+        loading_text.show()
+
+
+def load_project_data():
+    """Loads the project from the state, shows the progress of indexing
+    and unlocks the settings card when the project is loaded."""
+    loading_text.text = "Project is being loaded..."
+    loading_text.status = "info"
+    loading_text.show()
+
+    g.STATE.get_project_info(progress_cb=update_loading_text)
     no_class_handler()
 
+    loading_text.hide()
     project_thumbnail.set(g.STATE.project_info)
     project_thumbnail.show()
 
     settings.card.unlock()
     settings.card.uncollapse()
 
-    card.lock()
+
+def update_loading_text(datasets_done: int, datasets_total: int, images_indexed: int):
+    loading_text.text = (
+        f"Project is being loaded: {datasets_done} of {datasets_total} datasets, "
+        f"{images_indexed} images indexed."
+    )
 
 
 def clean_static_dir():
@@ -125,5 +210,6 @@ def clean_static_dir():
 def handle_input():
     card.unlock()
     select_project.enable()
+    filters_editor.enable()
     load_button.show()
     change_project_button.hide()
@@ -1,13 +1,11 @@
-from typing import Optional
-from copy import deepcopy
-from datetime import datetime
-import supervisely as sly
+from typing import Dict
 
-from random import sample, choice
+import supervisely as sly
 
 from supervisely.app.widgets import (
     Container,
     Card,
+    Checkbox,
     DestinationProject,
     Button,
     ProjectThumbnail,
@@ -18,13 +16,16 @@ from supervisely.app.widgets import (
     Flexbox,
 )
 
+import src.engine as engine
 import src.globals as g
+import src.metrics as metrics
 
 preview_table = Table(width=300)
 preview_tooltip = Text(
     text=(
-        "The result of sampling may be significantly different from the values in "
-        "this table because of duplication, small sample size, incorrect class distribution or other factors."
+        "The table shows the average result of several test runs of the sampling on the project "
+        f"and the range which contains {engine.PREVIEW_INTERVAL}% of the results. Images with several "
+        "classes are counted for each of them, images with the same names are counted only once."
     ),
     status="info",
 )
@@ -46,6 +47,28 @@ destination = DestinationProject(
     workspace_id=g.STATE.selected_workspace, project_type="images"
 )
 
+server_side_copy_checkbox = Checkbox(
+    "Copy annotations on the server", checked=g.STATE.server_side_copy
+)
+server_side_copy_field = Field(
+    title="Annotations",
+    description=(
+        "If checked, annotations will be copied from the source images on the server "
+        "without downloading them to the app, it's much faster for large annotations."
+    ),
+    content=server_side_copy_checkbox,
+)
+
+save_manifest_checkbox = Checkbox("Save manifest of the sample", checked=g.STATE.save_manifest)
+save_manifest_field = Field(
+    title="Manifest",
+    description=(
+        "If checked, IDs, hashes and classes of the sampled images with the seed and the settings "
+        "will be saved to the team files, so the same sample can be uploaded again without indexing the project."
+    ),
+    content=save_manifest_checkbox,
+)
+
 start_button = Button("Start sampling", icon="zmdi zmdi-play")
 stop_button = Button("Stop sampling", button_type="danger", icon="zmdi zmdi-stop")
 stop_button.hide()
@@ -55,6 +78,9 @@ buttons_flexbox = Flexbox([start_button, stop_button])
 progress = Progress()
 progress.hide()
 
+throughput_text = Text(status="info")
+throughput_text.hide()
+
 result_text = Text()
 result_text.hide()
 
@@ -68,8 +94,11 @@ card = Card(
         [
             preview_table_field,
             destination,
+            server_side_copy_field,
+            save_manifest_field,
             buttons_flexbox,
             progress,
+            throughput_text,
             result_text,
             project_thumbnail,
         ]
@@ -82,86 +111,58 @@ card.collapse()
 
 
 def build_preview_table():
-    columns = ["CLASS NAME", "NUMBER OF IMAGES"]
-    rows = []
-    total = 0
-    for class_name, percentage in g.STATE.class_distribution.items():
-        images_number = round(g.STATE.images_in_sample * percentage / 100)
-        rows.append([class_name, images_number])
-        total += images_number
-
-    preview_table.read_json(
-        {"columns": columns, "data": rows, "summaryRow": ["Total", total]}
+    fill_preview_table(
+        preview_table, g.STATE.class_distribution, g.STATE.images_in_sample
     )
 
     preview_table_field.show()
 
 
-def clear_preview_table():
-    preview_table.read_json({"columns": [], "data": [], "summaryRow": []})
-    preview_table_field.hide()
-
-
-def prepare_samples():
-    if g.STATE.sampling_method == "Random":
-        # Making list of unique images.
-        images = []
-
-        if g.STATE.images_by_class:
-            for image_datas in g.STATE.images_by_class.values():
-                for image_data in image_datas:
-                    image_name = image_data.info.name
-                    images_names = [_.info.name for _ in images]
-                    if image_name not in images_names:
-                        images.append(image_data)
-        else:
-            for image_data in g.STATE.images:
-                if image_data not in images:
-                    images.append(image_data)
-        if len(images) <= g.STATE.images_in_sample:
-            sly.logger.warning(
-                "Filtered images count is less than sample size. "
-                f"Number of filtered images: {len(images)}, sample size: {g.STATE.images_in_sample}. "
-                "This usually happens when the project contains same images in different datasets. "
-            )
-            samples = images
-        else:
-            samples = sample(images, g.STATE.images_in_sample)
-
-        sly.logger.debug(
-            f"Random method is selected, {len(samples)} random images was sampled."
-        )
+def fill_preview_table(
+    table: Table, class_distribution: Dict[str, float], images_in_sample: int
+):
+    estimate, (total, total_low, total_high) = engine.estimate_sample(
+        class_distribution, images_in_sample
+    )
 
-        return samples
+    columns = [
+        "CLASS NAME",
+        "EXPECTED NUMBER OF IMAGES",
+        f"RANGE ({engine.PREVIEW_INTERVAL}% OF RUNS)",
+    ]
+    rows = [
+        [class_name, round(mean), format_range(low, high)]
+        for class_name, (mean, low, high) in estimate.items()
+    ]
+
+    table.read_json(
+        {
+            "columns": columns,
+            "data": rows,
+            "summaryRow": ["Total unique images", round(total), format_range(total_low, total_high)],
+        }
+    )
 
-    samples = []
-    images_by_class = deepcopy(g.STATE.images_by_class)
-    for class_name, percentage in g.STATE.class_distribution.items():
-        images_number = round(g.STATE.images_in_sample * percentage / 100)
-        for _ in range(images_number):
-            image = choice(images_by_class[class_name])
 
-            image_name = image.info.name
-            samples_names = [_.info.name for _ in samples]
+def format_range(low: float, high: float) -> str:
+    return f"{round(low)} - {round(high)}"
 
-            images_by_class[class_name].remove(image)
-            if image_name not in samples_names:
-                samples.append(image)
-            else:
-                sly.logger.debug(
-                    f"Image {image.info.name} was already sampled from another class and was skipped."
-                )
 
-    sly.logger.debug(
-        f"Stratified or Custom method is selected, {len(samples)} images was sampled."
-    )
-
-    return samples
+def clear_preview_table():
+    preview_table.read_json({"columns": [], "data": [], "summaryRow": []})
+    preview_table_field.hide()
 
 
 @start_button.click
 def start_sampling():
-    samples = prepare_samples()
+    g.STATE.save_manifest = save_manifest_checkbox.is_checked()
+    g.STATE.destination = {
+        "project_id": destination.get_selected_project_id(),
+        "dataset_id": destination.get_selected_dataset_id(),
+        "project_name": destination.get_project_name(),
+        "dataset_name": destination.get_dataset_name(),
+    }
+    samples, job = engine.sample()
 
     if not samples:
         sly.app.show_dialog(
@@ -176,6 +177,7 @@ def start_sampling():
 
     project_id = destination.get_selected_project_id()
     dataset_id = destination.get_selected_dataset_id()
+    g.STATE.server_side_copy = server_side_copy_checkbox.is_checked()
 
     result_text.hide()
     project_thumbnail.hide()
@@ -188,58 +190,39 @@ def start_sampling():
         f"Project ID: {project_id}, dataset ID: {dataset_id}."
     )
 
-    if not project_id:
-        sly.logger.debug("Project ID is not specified, creating a new project.")
-        project_id = create_project(destination.get_project_name())
-    if not dataset_id:
-        sly.logger.debug("Dataset ID is not specified, creating a new dataset.")
-        dataset_id = create_dataset(project_id, destination.get_dataset_name())
-
-    g.api.project.update_meta(project_id, g.STATE.project_meta)
-
     progress.show()
+    throughput = metrics.Throughput(len(samples))
+    throughput_text.text = throughput.format()
+    throughput_text.show()
 
     with progress(message="Sampling images...", total=len(samples)) as pbar:
-        for batched_samples in sly.batched(samples):
-            if not g.STATE.continue_sampling:
-                sly.logger.debug("Stop button was clicked, stopping sampling...")
-                break
-
-            infos = [_.info for _ in batched_samples]
-            anns = [_.ann for _ in batched_samples]
-            names = [_.name for _ in infos]
-            ids = [_.id for _ in infos]
-            metas = [_.meta for _ in infos]
-
-            sly.logger.debug(
-                f"Uploading batch of {len(batched_samples)} images. Image IDs: {ids}"
-            )
-
-            uploaded_ids = g.api.image.upload_ids(
-                dataset_id=dataset_id,
-                names=names,
-                ids=ids,
-                metas=metas,
-                infos=infos,
-            )
-            g.api.annotation.upload_anns(
-                img_ids=[_.id for _ in uploaded_ids],
-                anns=anns,
-            )
-
-            sly.logger.info(f"Uploaded batch of {len(batched_samples)} images.")
-            pbar.update(len(batched_samples))
-
-    sly.logger.info(
-        f"Sampling is finished. Uploaded {len(samples)} images to dataset with ID {dataset_id}."
-    )
+
+        def update_progress(count: int):
+            pbar.update(count)
+            throughput.update(count)
+            throughput_text.text = throughput.format()
+
+        project_id, dataset_id, _ = engine.upload_samples(
+            samples,
+            job,
+            project_id,
+            dataset_id,
+            destination.get_project_name(),
+            destination.get_dataset_name(),
+            update_progress,
+        )
+
+    throughput_text.hide()
 
     if g.STATE.continue_sampling:
         result_text.text = "Successfully sampled images."
         result_text.status = "success"
 
     else:
-        result_text.text = "The sampling was stopped before the end."
+        result_text.text = (
+            "The sampling was stopped before the end. "
+            "Run the app with the same settings to upload the rest of the images."
+        )
         result_text.status = "warning"
 
     result_text.show()
@@ -263,23 +246,3 @@ def stop_generation():
     stop_button.text = "Stopping..."
     stop_button.loading = True
     g.STATE.continue_sampling = False
-
-
-def create_project(project_name: Optional[str]) -> int:
-    if not project_name:
-        project_name = f"{g.STATE.project_info.name} (sample)"
-
-    project = g.api.project.create(
-        g.STATE.selected_workspace, project_name, change_name_if_conflict=True
-    )
-    return project.id
-
-
-def create_dataset(project_id: int, dataset_name: Optional[str]) -> int:
-    if not dataset_name:
-        dataset_name = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (sample)"
-
-    dataset = g.api.dataset.create(
-        project_id, dataset_name, change_name_if_conflict=True
-    )
-    return dataset.id
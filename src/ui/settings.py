@@ -1,5 +1,5 @@
 import yaml
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from supervisely.app.widgets import (
     Text,
     Card,
@@ -10,10 +10,10 @@ from supervisely.app.widgets import (
     Button,
     Container,
     Flexbox,
+    Table,
 )
 
-import supervisely as sly
-
+import src.engine as engine
 import src.globals as g
 import src.ui.output as output
 
@@ -55,11 +55,31 @@ unlock_settings_button = Button("Change settings", icon="zmdi zmdi-lock-open")
 unlock_settings_button.hide()
 
 
+# Maximum number of strata of image tags and meta fields listed in the editor.
+MAX_EDITOR_STRATA = 50
+
 distribution_editor = Editor(language_mode="yaml", height_lines=50)
+preview_button = Button(
+    "Preview sample", button_type="plain", icon="zmdi zmdi-eye"
+)
+preview_error_text = Text(status="warning")
+preview_error_text.hide()
+distribution_preview_table = Table(width=300)
+distribution_preview_table.hide()
 distribution_field = Field(
     title="Class distribution",
-    description="Set the percentage of each class in the sample.",
-    content=distribution_editor,
+    description=(
+        "Set the percentage of each class in the sample. "
+        "Click the preview button to see the expected result of the sampling."
+    ),
+    content=Container(
+        [
+            distribution_editor,
+            preview_button,
+            preview_error_text,
+            distribution_preview_table,
+        ]
+    ),
 )
 distribution_field.hide()
 
@@ -118,8 +138,14 @@ def update_custom_editor(sample_size: Optional[int] = None):
     if not sample_size:
         sample_size = get_sample_size()
 
-    calculate_maximum_percentage(sample_size)
-    percentages = distribute_percentages(len(g.STATE.class_stats))
+    if not g.STATE.index_loaded:
+        # Maximums are calculated from the numbers of images in the index.
+        g.STATE.load_index()
+    # The editor is filled without excluded images.
+    g.STATE.exclude = []
+
+    engine.calculate_maximum_percentage(sample_size)
+    percentages = engine.distribute_percentages(len(g.STATE.class_stats))
 
     editor_text = (
         f"# Total images count in sample: {g.STATE.images_in_sample}\n\n"
@@ -131,34 +157,65 @@ def update_custom_editor(sample_size: Optional[int] = None):
         percentage = min(percentage, class_dict["maximum_percentage"])
         editor_text += f"  {class_name}: {percentage} # Maximum: {class_dict['maximum_percentage']}\n"
 
+    if g.STATE.images_by_key:
+        editor_text += "\n  # Image tags and meta fields, uncomment to use them.\n"
+    for stratum in list(g.STATE.images_by_key.keys())[:MAX_EDITOR_STRATA]:
+        editor_text += (
+            f'  # "{stratum}": 0 # Maximum: {engine.get_maximum_percentage(stratum)}\n'
+        )
+    editor_text += (
+        "\n  # Classes and strata can be combined with & (and), | (or) and ! (not),\n"
+        '  # e.g. "car & tag:weather=rain" or "pedestrian & !cyclist".\n'
+        "\n# Images of these classes, strata or expressions are not sampled.\n"
+        "exclude: []\n"
+    )
+
     distribution_editor.set_text(editor_text)
+    distribution_preview_table.hide()
+    preview_error_text.hide()
     distribution_field.show()
     lock_settings_button.loading = False
 
 
-def calculate_maximum_percentage(sample_size):
-    g.STATE.images_in_sample = round(sample_size * g.STATE.total_images_count / 100)
+@preview_button.click
+def preview_distribution():
+    preview_button.loading = True
+    preview_error_text.hide()
 
-    sly.logger.debug(
-        f"Number of images in the sample with sample size {sample_size}: {g.STATE.images_in_sample}"
-    )
+    try:
+        class_distribution, exclude = read_distribution()
+        sample_size = get_sample_size()
+        if not g.STATE.index_loaded:
+            g.STATE.load_index()
+        for name in exclude:
+            g.STATE.get_bitmap(name)
+        g.STATE.exclude = exclude
+
+        # Percentages are changed in the same way as when the settings are saved.
+        engine.calculate_maximum_percentage(sample_size)
+        engine.clamp_distribution(class_distribution)
+        output.fill_preview_table(
+            distribution_preview_table, class_distribution, g.STATE.images_in_sample
+        )
+        distribution_preview_table.show()
+    except (yaml.YAMLError, ValueError) as e:
+        preview_error_text.text = f"Can't preview the sample: {e}"
+        preview_error_text.show()
+        distribution_preview_table.hide()
+    finally:
+        preview_button.loading = False
 
-    for class_name, class_dict in g.STATE.class_stats.items():
-        class_total = class_dict["total"]
-        if class_total == 0:
-            maximum_percentage = 0
-        else:
-            maximum_percentage = (
-                round(class_total * 100 / g.STATE.images_in_sample)
-                if g.STATE.images_in_sample > class_total
-                else 100
-            )
 
-        g.STATE.class_stats[class_name]["maximum_percentage"] = maximum_percentage
+def read_distribution() -> Tuple[Dict[str, float], List[str]]:
+    """Returns the distribution and the list of excluded classes, strata or expressions."""
+    config = yaml.safe_load(distribution_editor.get_text())
+    if not isinstance(config, dict) or not isinstance(config.get("distribution"), dict):
+        raise ValueError("The distribution must be a mapping of class names to percentages.")
+    exclude = config.get("exclude") or []
+    if not isinstance(exclude, list):
+        raise ValueError("Excluded classes must be a list.")
 
-    sly.logger.debug(
-        f"Maximum percentages for each class was saved in the state: {g.STATE.class_stats}"
-    )
+    return config["distribution"], [str(name) for name in exclude]
 
 
 @lock_settings_button.click
@@ -170,44 +227,26 @@ def lock_settings():
 
     output.total_percentage_text.hide()
     output.bad_distribution_text.hide()
+    preview_error_text.hide()
 
-    g.STATE.sampling_method = sampling_method
-
-    g.STATE.sample_size = get_sample_size()
-
-    g.STATE.images_in_sample = round(
-        g.STATE.sample_size * g.STATE.total_images_count / 100
-    )
-
-    sly.logger.info(
-        f"Settings locked. Sampling method: {sampling_method}, sample size: {g.STATE.sample_size}"
-    )
-
-    if sampling_method == "Custom":
-        g.STATE.class_distribution = yaml.safe_load(distribution_editor.get_text()).get(
-            "distribution"
-        )
-        sly.logger.info(
-            f"Custom method is selected. Distribution: {g.STATE.class_distribution}"
+    lock_settings_button.loading = True
+    try:
+        class_distribution = None
+        exclude = None
+        if sampling_method == "Custom":
+            class_distribution, exclude = read_distribution()
+
+        distribution_changed = engine.plan(
+            sampling_method, get_sample_size(), class_distribution, exclude=exclude
         )
+    except (yaml.YAMLError, ValueError) as e:
+        preview_error_text.text = f"Can't save the settings: {e}"
+        preview_error_text.show()
+        return
+    finally:
+        lock_settings_button.loading = False
 
-        distribution_changed = False
-        for class_name, class_distribution in g.STATE.class_distribution.items():
-            if (
-                class_distribution
-                > g.STATE.class_stats[class_name]["maximum_percentage"]
-            ):
-                g.STATE.class_distribution[class_name] = g.STATE.class_stats[
-                    class_name
-                ]["maximum_percentage"]
-
-                distribution_changed = True
-
-            elif class_distribution < 0:
-                g.STATE.class_distribution[class_name] = 0
-
-                distribution_changed = True
-
+    if sampling_method == "Custom":
         if distribution_changed:
             output.bad_distribution_text.text = (
                 "At least one class percentage is more than maximum or less than 0. "
@@ -224,19 +263,7 @@ def lock_settings():
             )
             output.total_percentage_text.show()
 
-        output.build_preview_table()
-
-    elif sampling_method == "Stratified":
-        total_class_images = sum(
-            [class_dict["total"] for class_dict in g.STATE.class_stats.values()]
-        )
-        distribution = {}
-        for class_name, class_dict in g.STATE.class_stats.items():
-            percentage = round(class_dict["total"] * 100 / total_class_images)
-            distribution[class_name] = percentage
-
-        g.STATE.class_distribution = distribution
-
+    if sampling_method != "Random":
         output.build_preview_table()
 
     unlock_settings_button.show()
@@ -253,6 +280,7 @@ def unlock_settings():
     g.STATE.sampling_method = None
     g.STATE.sample_size = None
     g.STATE.class_distribution = None
+    g.STATE.exclude = []
 
     output.clear_preview_table()
 
@@ -265,28 +293,11 @@ def unlock_settings():
     card.uncollapse()
 
 
-def distribute_percentages(num_parts: int):
-    quotient = 100 // num_parts
-    remainder = 100 % num_parts
-
-    parts = [quotient] * num_parts
-
-    for i in range(remainder):
-        parts[i] += 1
-
-    return parts
-
-
 def get_sample_size():
     if sample_type_select.get_value() == "Percentage":
         return sample_size_percentage_input.get_value()
 
-    sample_size = int(
-        (sample_size_number_input.get_value() / g.STATE.total_images_count) * 100
-    )
-
-    sample_size = sample_size if sample_size <= 100 else 100
-    return sample_size
+    return engine.images_number_to_percentage(sample_size_number_input.get_value())
 
 
 @sample_type_select.value_changed
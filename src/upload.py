@@ -0,0 +1,394 @@
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import supervisely as sly
+
+import src.globals as g
+import src.metrics as metrics
+from src.journal import Journal
+
+# Source IDs of uploaded images, upload time in seconds, size of uploaded annotations in bytes
+# (0 if annotations were not serialized) and number of failed requests which were retried.
+BatchResult = namedtuple("BatchResult", ["ids", "duration", "annotations_size", "failed_requests"])
+
+# Number of images in the first batch, the size is changed after each uploaded batch.
+INITIAL_BATCH_SIZE = 10
+# Batches which are uploaded longer than this number of seconds are considered slow.
+SLOW_BATCH_SECONDS = 60
+# Batch size is increased only if the upload time per image is decreased by this ratio.
+LATENCY_IMPROVEMENT = 0.9
+# Batch size stops growing after this number of batches without improvement in a row.
+GROWTH_PATIENCE = 2
+
+
+class AnnotationsUploadError(Exception):
+    """Images of the batch were uploaded, but their annotations were not, so the batch can't be
+    retried. Source IDs of the images which were left in the destination are in image_ids."""
+
+    def __init__(self, message: str, image_ids: Optional[List[int]] = None):
+        super().__init__(message)
+        self.image_ids = image_ids or []
+
+
+class AdaptiveBatchSize:
+    """Size of the upload batches, it's doubled while the upload time per image decreases
+    and halved when the batch fails or is too slow."""
+
+    def __init__(self, min_size: int, max_size: int, max_bytes: int):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.max_bytes = max_bytes
+        self.size = min(max(INITIAL_BATCH_SIZE, self.min_size), self.max_size)
+        self.growing = True
+        self.stalls = 0
+        # Best upload time per image and average size of the annotation of one image.
+        self.best_latency = None
+        self.image_bytes = None
+
+    def update(self, result: BatchResult):
+        """Adjusts the size by the results of the uploaded batch."""
+        batch_size, duration = len(result.ids), result.duration
+        if result.annotations_size:
+            self.image_bytes = result.annotations_size / batch_size
+            bytes_limit = max(1, int(self.max_bytes / self.image_bytes))
+            if self.size > bytes_limit:
+                self.resize(
+                    bytes_limit,
+                    f"annotations are {round(self.image_bytes)} bytes per image "
+                    f"and the limit is {self.max_bytes} bytes per batch",
+                )
+                self.growing = False
+
+        if result.failed_requests:
+            self.shrink(batch_size, f"{result.failed_requests} requests of the batch failed")
+            return
+        if duration > SLOW_BATCH_SECONDS:
+            self.shrink(batch_size, f"batch took {duration:.1f} s")
+            return
+
+        if not self.growing or batch_size < self.size:
+            # Results of the batches which were started before the last change are skipped.
+            return
+
+        latency = duration / batch_size
+        if self.best_latency is None or latency < self.best_latency * LATENCY_IMPROVEMENT:
+            self.best_latency = latency
+            self.stalls = 0
+            if self.image_bytes is None or (self.size * 2) * self.image_bytes <= self.max_bytes:
+                self.resize(self.size * 2, f"upload time per image is {latency:.4f} s")
+            return
+
+        self.stalls += 1
+        if self.stalls >= GROWTH_PATIENCE:
+            self.growing = False
+            sly.logger.info(
+                f"Upload batch size {self.size} is kept: upload time per image is {latency:.4f} s, "
+                f"it's not less than {self.best_latency:.4f} s for smaller batches."
+            )
+
+    def failed(self, batch_size: int, error: Exception) -> bool:
+        """Halves the size after the failed batch. Returns False if the batch
+        had the minimum size already, so it can't be retried with a smaller one."""
+        if batch_size <= self.min_size:
+            self.growing = False
+            return False
+
+        self.shrink(batch_size, f"batch failed with {error!r}")
+        return True
+
+    def shrink(self, batch_size: int, reason: str):
+        # The batch could be started before the last change, so the size is never increased here.
+        self.growing = False
+        self.resize(min(self.size, batch_size // 2), f"{reason}, it had {batch_size} images")
+
+    def resize(self, size: int, reason: str):
+        size = min(max(size, self.min_size), self.max_size)
+        if size != self.size:
+            sly.logger.info(f"Upload batch size is changed from {self.size} to {size}: {reason}.")
+            self.size = size
+
+
+def upload_samples(
+    dataset_id: int,
+    samples: List[g.ImageData],
+    progress_cb: Optional[Callable[[int], None]] = None,
+    journal: Optional[Journal] = None,
+) -> int:
+    """Uploads sampled images with their annotations to the dataset in concurrent batches,
+    returns the number of uploaded images."""
+    uploaded = 0
+
+    if journal is not None and journal.committed_ids:
+        remaining = [
+            image_data
+            for image_data in samples
+            if image_data.info.id not in journal.committed_ids
+        ]
+        sly.logger.info(
+            f"{len(samples) - len(remaining)} images were already uploaded by this job and will be skipped."
+        )
+        if progress_cb is not None:
+            progress_cb(len(samples) - len(remaining))
+        samples = remaining
+
+    batch_size = AdaptiveBatchSize(
+        g.UPLOAD_BATCH_SIZE_MIN, g.UPLOAD_BATCH_SIZE_MAX, g.UPLOAD_BATCH_MAX_BYTES
+    )
+    # Images from one dataset are uploaded together, so infos and annotations
+    # of the batch are usually requested from one dataset.
+    queue = deque(sorted(samples, key=lambda image_data: image_data.info.dataset_id))
+
+    def collect(future, batched_samples):
+        nonlocal uploaded
+        try:
+            result = future.result()
+        except AnnotationsUploadError as e:
+            if journal is not None and e.image_ids:
+                # Images without annotations are committed, so a resumed job doesn't upload them again.
+                journal.commit(e.image_ids)
+                sly.logger.warning(
+                    f"{len(e.image_ids)} images were left in the destination without annotations: {e.image_ids}"
+                )
+            raise
+        except Exception as e:
+            if not batch_size.failed(len(batched_samples), e):
+                raise
+            # Images of the failed batch were not registered, so they are returned
+            # to the queue and will be uploaded in smaller batches.
+            queue.extendleft(reversed(batched_samples))
+            return
+
+        batch_size.update(result)
+        if journal is not None:
+            journal.commit(result.ids)
+        uploaded += len(result.ids)
+        if progress_cb is not None:
+            progress_cb(len(result.ids))
+
+    sly.logger.debug(f"Uploading {len(samples)} images with {g.UPLOAD_WORKERS} workers.")
+
+    error = None
+    with ThreadPoolExecutor(max_workers=g.UPLOAD_WORKERS) as executor:
+        in_flight = dict()
+        while queue or in_flight:
+            # Limiting the number of batches in flight, so the stop button
+            # will not wait for the whole queue.
+            if (
+                error is None
+                and queue
+                and len(in_flight) < g.UPLOAD_WORKERS
+                and g.STATE.continue_sampling
+            ):
+                batched_samples = [queue.popleft() for _ in range(min(batch_size.size, len(queue)))]
+                future = executor.submit(upload_timed_batch, dataset_id, batched_samples)
+                in_flight[future] = batched_samples
+                continue
+
+            if not in_flight:
+                if error is None:
+                    sly.logger.debug("Stop button was clicked, stopping sampling...")
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    collect(future, in_flight.pop(future))
+                except Exception as e:
+                    # Batches in progress are finished and committed to the journal,
+                    # so they are not uploaded again when the job is resumed.
+                    if error is None:
+                        error = e
+                    else:
+                        sly.logger.warning(f"Another batch failed with {e!r}.")
+
+    if error is not None:
+        raise error
+
+    return uploaded
+
+
+def upload_timed_batch(dataset_id: int, batched_samples: List[g.ImageData]) -> BatchResult:
+    start = time.perf_counter()
+    result = upload_batch(dataset_id, batched_samples)
+    return result._replace(duration=time.perf_counter() - start)
+
+
+def upload_batch(dataset_id: int, batched_samples: List[g.ImageData]) -> BatchResult:
+    """Uploads the batch of images with annotations, failures after the images
+    are registered raise AnnotationsUploadError."""
+    infos = [_.info for _ in batched_samples]
+    if not all(isinstance(info, sly.ImageInfo) for info in infos):
+        infos = download_image_infos(infos)
+        if len(infos) < len(batched_samples):
+            found_ids = {info.id for info in infos}
+            batched_samples = [_ for _ in batched_samples if _.info.id in found_ids]
+    anns = [_.ann for _ in batched_samples]
+    names = [_.name for _ in infos]
+    ids = [_.id for _ in infos]
+    metas = [_.meta for _ in infos]
+
+    ann_jsons = None
+    annotations_size = 0
+    if not g.STATE.server_side_copy and None in anns:
+        # Lightweight index doesn't keep annotations in memory.
+        ann_jsons = download_ann_jsons(infos)
+        annotations_size = sum(map(metrics.json_size, ann_jsons))
+
+    sly.logger.debug(
+        f"Uploading batch of {len(batched_samples)} images. Image IDs: {ids}"
+    )
+
+    # The whole batch is sent in one request, so it's either uploaded or not.
+    # Images are registered by their hashes, so no image data is sent and bytes are not counted.
+    with g.STATE.metrics.stage("upload_ids", items=len(ids)):
+        uploaded_ids = g.api.image.upload_ids(
+            dataset_id=dataset_id,
+            names=names,
+            ids=ids,
+            metas=metas,
+            infos=infos,
+            batch_size=len(ids),
+        )
+
+    dst_ids = [_.id for _ in uploaded_ids]
+    try:
+        if g.STATE.server_side_copy:
+            # Annotations never pass through the app.
+            with g.STATE.metrics.stage("copy_anns", items=len(ids)):
+                failed_requests = upload_annotations(
+                    lambda src_ids, part_ids: g.api.annotation.copy_batch_by_ids(
+                        src_ids, part_ids, batch_size=len(src_ids)
+                    ),
+                    dst_ids,
+                    ids,
+                )
+        elif ann_jsons is not None:
+            with g.STATE.metrics.stage("upload_anns", items=len(ann_jsons), size=annotations_size):
+                failed_requests = upload_annotations(
+                    lambda ann_jsons, part_ids: g.api.annotation.upload_jsons(
+                        img_ids=part_ids, ann_jsons=ann_jsons
+                    ),
+                    dst_ids,
+                    ann_jsons,
+                )
+        else:
+            with g.STATE.metrics.stage("upload_anns", items=len(anns)):
+                failed_requests = upload_annotations(
+                    lambda anns, part_ids: g.api.annotation.upload_anns(img_ids=part_ids, anns=anns),
+                    dst_ids,
+                    anns,
+                )
+    except Exception as e:
+        # Images are already registered, they are removed, so they are not duplicated when the job
+        # is resumed. If they can't be removed, they are committed to the journal by the caller.
+        try:
+            g.api.image.remove_batch(dst_ids)
+            left_ids = []
+        except Exception as remove_error:
+            sly.logger.warning(f"Images of the failed batch can't be removed: {remove_error!r}")
+            left_ids = ids
+        raise AnnotationsUploadError(
+            f"Images of the batch were uploaded, but their annotations were not: {e!r}", left_ids
+        ) from e
+
+    sly.logger.info(f"Uploaded batch of {len(batched_samples)} images.")
+    return BatchResult(ids, 0.0, annotations_size, failed_requests)
+
+
+def upload_annotations(
+    upload_func: Callable[[List, List[int]], None], dst_ids: List[int], annotations: List
+) -> int:
+    """Uploads annotations to the uploaded images, failed requests are retried with halves
+    of the batch. Returns the number of failed requests."""
+    try:
+        upload_func(annotations, dst_ids)
+        return 0
+    except Exception as e:
+        if len(dst_ids) == 1:
+            raise AnnotationsUploadError(
+                f"Annotation of the image {dst_ids[0]} can't be uploaded: {e!r}"
+            ) from e
+
+        sly.logger.warning(
+            f"Upload of annotations for {len(dst_ids)} images failed with {e!r}, "
+            "it will be retried in two parts."
+        )
+        half = len(dst_ids) // 2
+        return (
+            1
+            + upload_annotations(upload_func, dst_ids[:half], annotations[:half])
+            + upload_annotations(upload_func, dst_ids[half:], annotations[half:])
+        )
+
+
+def download_image_infos(
+    infos: List[Union[sly.ImageInfo, g.ImageRecord]]
+) -> List[sly.ImageInfo]:
+    """Downloads full ImageInfos for images from different datasets in the order of infos."""
+    image_infos = {}
+    for dataset_id, image_ids in group_by_dataset(infos).items():
+        with g.STATE.metrics.stage("get_image_infos", items=len(image_ids)):
+            image_infos.update(
+                (image_info.id, image_info)
+                for image_info in g.api.image.get_list(
+                    dataset_id,
+                    filters=[{"field": "id", "operator": "in", "value": image_ids}],
+                )
+            )
+
+    missing_count = sum(info.id not in image_infos for info in infos)
+    if missing_count:
+        sly.logger.warning(
+            f"{missing_count} sampled images were removed from the source project and will be skipped."
+        )
+
+    return [image_infos[info.id] for info in infos if info.id in image_infos]
+
+
+def drop_missing_images(
+    samples: List[g.ImageData], skip_ids: Iterable[int] = ()
+) -> List[g.ImageData]:
+    """Requests full infos of the samples, images removed from the source are dropped."""
+    skip_ids = set(skip_ids)
+    records = [
+        image_data.info
+        for image_data in samples
+        if not isinstance(image_data.info, sly.ImageInfo) and image_data.info.id not in skip_ids
+    ]
+    if not records:
+        return samples
+
+    image_infos = {image_info.id: image_info for image_info in download_image_infos(records)}
+    return [
+        image_data._replace(info=image_infos[image_data.info.id])
+        if image_data.info.id in image_infos
+        else image_data
+        for image_data in samples
+        if image_data.info.id in image_infos
+        or image_data.info.id in skip_ids
+        or isinstance(image_data.info, sly.ImageInfo)
+    ]
+
+
+def download_ann_jsons(infos: List[Union[sly.ImageInfo, g.ImageRecord]]) -> List[dict]:
+    """Downloads annotations for images from different datasets in the order of infos."""
+    ann_jsons = {}
+    for dataset_id, image_ids in group_by_dataset(infos).items():
+        with g.STATE.metrics.stage("download_annotations", items=len(image_ids)):
+            ann_jsons.update(
+                zip(image_ids, g.api.annotation.download_json_batch(dataset_id, image_ids))
+            )
+
+    return [ann_jsons[info.id] for info in infos]
+
+
+def group_by_dataset(
+    infos: List[Union[sly.ImageInfo, g.ImageRecord]]
+) -> Dict[int, List[int]]:
+    ids_by_dataset = defaultdict(list)
+    for info in infos:
+        ids_by_dataset[info.dataset_id].append(info.id)
+
+    return ids_by_dataset